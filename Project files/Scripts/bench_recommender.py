@@ -0,0 +1,92 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from xgboost import XGBRegressor
+
+from recommender import CUSTOMER_FEATURES, FEATURES, recommend_top_k
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Data files')
+
+
+def legacy_recommend(model, product_ids, product_names, customer_data, k=10):
+    # The DataFrame path view_recommended_cart() used before recommend_top_k().
+    sample_customer_data = pd.DataFrame({
+        'ProductID': product_ids,
+        'Month': [pd.Timestamp('today').month] * len(product_ids),
+        'DayOfWeek': [pd.Timestamp('today').dayofweek] * len(product_ids),
+        'TotalOrders': [customer_data['TotalOrders']] * len(product_ids),
+        'AvgQuantity': [customer_data['AvgQuantity']] * len(product_ids),
+        'MostBoughtProduct': [customer_data['MostBoughtProduct']] * len(product_ids)
+    })
+    predicted_quantities = model.predict(sample_customer_data)
+    sample_customer_data['ProductName'] = product_names
+    sample_customer_data['PredictedQuantity'] = predicted_quantities
+    return sample_customer_data.sort_values(by='PredictedQuantity', ascending=False).head(k)
+
+
+def stand_in_model(n_products, seed=42):
+    rng = np.random.default_rng(seed)
+    n_rows = 50000
+    X = pd.DataFrame({
+        'ProductID': rng.integers(0, n_products, n_rows),
+        'Month': rng.integers(1, 13, n_rows),
+        'DayOfWeek': rng.integers(0, 7, n_rows),
+        'TotalOrders': rng.integers(1, 80, n_rows),
+        'AvgQuantity': rng.uniform(1, 5, n_rows),
+        'MostBoughtProduct': rng.integers(0, n_products, n_rows),
+    })[FEATURES]
+    y = rng.integers(1, 6, n_rows) + (X['ProductID'] % 7 == 0)
+    return XGBRegressor(learning_rate=0.01, max_depth=3, n_estimators=200, objective='reg:squarederror').fit(X, y)
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the DataFrame and array-native recommender inference paths.")
+    parser.add_argument('--model', help="Trained XGBoost model (JSON); a stand-in is trained when omitted")
+    parser.add_argument('--customers', type=int, default=100, help="Batch size for the multi-customer comparison")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    product_names = pd.read_csv(os.path.join(DATA_DIR, 'ProductsOnWebsite.csv'))['ProductName'].unique()
+    product_ids = np.arange(len(product_names))
+    if args.model:
+        model = XGBRegressor()
+        model.load_model(args.model)
+    else:
+        model = stand_in_model(len(product_ids))
+    rng = np.random.default_rng(0)
+    customers = pd.DataFrame({
+        'TotalOrders': rng.integers(1, 80, args.customers),
+        'AvgQuantity': rng.uniform(1, 5, args.customers),
+        'MostBoughtProduct': rng.integers(0, len(product_ids), args.customers),
+    })
+    month, day_of_week = pd.Timestamp('today').month, pd.Timestamp('today').dayofweek
+
+    legacy = legacy_recommend(model, product_ids, product_names, customers.iloc[0])
+    indices, scores = recommend_top_k(model, product_ids, customers[CUSTOMER_FEATURES].to_numpy()[:1], month, day_of_week)
+    assert np.allclose(np.sort(legacy['PredictedQuantity'].to_numpy()), np.sort(scores[0]))
+
+    single_legacy = timed(lambda: legacy_recommend(model, product_ids, product_names, customers.iloc[0]), args.repeat)
+    single_native = timed(lambda: recommend_top_k(model, product_ids, customers[CUSTOMER_FEATURES].to_numpy()[:1], month, day_of_week), args.repeat)
+    batch_legacy = timed(lambda: [legacy_recommend(model, product_ids, product_names, row) for _, row in customers.iterrows()], 1)
+    batch_native = timed(lambda: recommend_top_k(model, product_ids, customers[CUSTOMER_FEATURES].to_numpy(), month, day_of_week), args.repeat)
+
+    print(f"{len(product_ids)} products, model with {model.get_booster().num_boosted_rounds()} trees")
+    print(f"{'':<22}{'legacy':>10}{'native':>10}{'speedup':>10}")
+    print(f"{'1 customer':<22}{single_legacy * 1000:>8.1f}ms{single_native * 1000:>8.1f}ms{single_legacy / single_native:>9.1f}x")
+    print(f"{f'{args.customers} customers':<22}{batch_legacy * 1000:>8.1f}ms{batch_native * 1000:>8.1f}ms{batch_legacy / batch_native:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
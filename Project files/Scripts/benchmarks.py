@@ -0,0 +1,209 @@
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+import pandas as pd
+
+import model_registry
+from db import ensure_indexes, get_db_connection, max_rowid, read_customer_orders, read_table
+from generate_orders import OrderGenerator, SQLiteSink, load_catalog
+from operations import filter_products, forecast_demand, order_history, place_order, price_cart, recommend_products
+
+DATA_DIR = 'bench_data'
+DEFAULT_SCALES = [10_000, 1_000_000, 10_000_000]
+ORDERS_PER_CUSTOMER = 10
+LINES_PER_ORDER = 14
+# Default repetitions per operation; the heavy ones run fewer times.
+REPEATS = {'load_orders': 3, 'search': 50, 'recommend': 10, 'shopping_history': 20,
+           'checkout': 20, 'demand_forecast': 3}
+# Operations that append to Orders; their rows are removed once they have been measured.
+WRITES = {'checkout'}
+
+
+def scale_database(lines, data_dir=DATA_DIR, seed=42):
+    path = os.path.join(data_dir, f'orders_{lines}.db')
+    if os.path.exists(path):
+        return path
+    os.makedirs(data_dir, exist_ok=True)
+    customers = max(1, round(lines / (ORDERS_PER_CUSTOMER * LINES_PER_ORDER)))
+    products_df = load_catalog()
+    generator = OrderGenerator(products_df, customers, ORDERS_PER_CUSTOMER, skew=1.0, seasonality=0.3, seed=seed)
+    tmp_path = f'{path}.tmp'
+    sink = SQLiteSink(tmp_path, products_df, customers, replace=True)
+    for chunk in generator.chunks(2000):
+        sink.write(chunk)
+    sink.close()
+    os.replace(tmp_path, path)
+    return path
+
+
+@contextmanager
+def discarding_new_orders(database):
+    # Keeps the cached databases at their generated size, so every run, and the operations
+    # measured after a write, see the same Orders table.
+    watermark = max_rowid("Orders", database) or 0
+    try:
+        yield
+    finally:
+        with get_db_connection(database) as conn:
+            conn.execute("DELETE FROM Orders WHERE rowid > ?", (watermark,))
+            conn.commit()
+
+
+def load_models(products_df, registry_dir):
+    version = model_registry.current_version(registry_dir)
+    if version is not None:
+        model, demand_model, le_product = model_registry.load_version(version, registry_dir)
+        return model, demand_model, le_product, version
+    # Stand-ins with the production feature layout, for trees without trained artifacts.
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.preprocessing import LabelEncoder
+    from bench_recommender import stand_in_model
+    le_product = LabelEncoder().fit(products_df['ProductName'])
+    rng = np.random.default_rng(42)
+    demand_model = RandomForestRegressor(n_estimators=100, max_depth=12, random_state=42)
+    demand_model.fit(rng.normal(size=(20000, 14)), rng.integers(1, 60, 20000))
+    return stand_in_model(len(le_product.classes_)), model_registry.PackedForest.from_estimator(demand_model), le_product, 'stand-in'
+
+
+def operations(database, products_df, customers, model, demand_model, le_product, rng):
+    words = products_df['ProductName'].str.split().explode().str.lower().unique()
+    categories = products_df['Category'].unique()
+
+    def customer():
+        return customers[rng.integers(len(customers))]
+
+    def checkout():
+        cart = list(rng.choice(products_df['ProductName'].to_numpy(), size=rng.integers(3, 15)))
+        cart_items_data, _ = price_cart(cart, products_df)
+        place_order(customer(), cart_items_data, database)
+
+    # Each operation reads what its page reads: the customer's orders through the CustomerID
+    # index, or the whole table for a forecast the app has not cached yet.
+    def recommend():
+        customer_id = customer()
+        return recommend_products(read_customer_orders(customer_id, database), products_df, customer_id, model, le_product)
+
+    def shopping_history():
+        customer_id = customer()
+        return order_history(read_customer_orders(customer_id, database), customer_id)
+
+    return {
+        'load_orders': lambda: read_table("Orders", database),
+        'search': lambda: filter_products(products_df, rng.choice(categories), rng.choice(words)),
+        'recommend': recommend,
+        'shopping_history': shopping_history,
+        'checkout': checkout,
+        'demand_forecast': lambda: forecast_demand(read_table("Orders", database), products_df, demand_model),
+    }
+
+
+def measure(fn, repeat):
+    fn()  # warm-up
+    latencies = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    latencies = np.asarray(latencies)
+    return {
+        'repeat': repeat,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p90_ms': float(np.percentile(latencies, 90)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'mean_ms': float(latencies.mean()),
+        'max_ms': float(latencies.max()),
+        'peak_mb': peak / 2 ** 20,
+    }
+
+
+def run(scales, selected, repeat_factor, registry_dir, data_dir):
+    products_df = read_table("ProductsOnWebsite", scale_database(scales[0], data_dir))
+    model, demand_model, le_product, model_version = load_models(products_df, registry_dir)
+    results = {}
+    for lines in scales:
+        database = scale_database(lines, data_dir)
+        ensure_indexes(database)
+        products_df = read_table("ProductsOnWebsite", database)
+        customers = read_table("customers", database)['name'].to_numpy()
+        ops = operations(database, products_df, customers, model, demand_model, le_product, np.random.default_rng(0))
+        results[str(lines)] = {}
+        for name in selected:
+            repeat = max(1, int(REPEATS[name] * repeat_factor))
+            with discarding_new_orders(database) if name in WRITES else nullcontext():
+                results[str(lines)][name] = stats = measure(ops[name], repeat)
+            print(f"{lines:>12,} {name:<18} p50 {stats['p50_ms']:>10.1f}ms  p99 {stats['p99_ms']:>10.1f}ms  "
+                  f"peak {stats['peak_mb']:>8.1f}MB", flush=True)
+    return results, model_version
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline, threshold):
+    # Returns the (scale, operation, baseline p50, current p50) entries that slowed down by more than threshold.
+    regressions = []
+    for scale, ops in current['results'].items():
+        for name, stats in ops.items():
+            before = baseline['results'].get(scale, {}).get(name)
+            if before is None:
+                continue
+            change = stats['p50_ms'] / before['p50_ms'] - 1
+            print(f"{int(scale):>12,} {name:<18} {before['p50_ms']:>10.1f}ms -> {stats['p50_ms']:>10.1f}ms  {change:+7.1%}")
+            if change > threshold:
+                regressions.append((scale, name, before['p50_ms'], stats['p50_ms']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the app's hot paths against generated databases.")
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES, help="Order lines per generated database")
+    parser.add_argument('--ops', nargs='+', choices=list(REPEATS), default=list(REPEATS))
+    parser.add_argument('--repeat-factor', type=float, default=1.0, help="Multiply the default repetitions")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="Where generated databases are cached")
+    parser.add_argument('--registry', default=model_registry.REGISTRY_DIR)
+    parser.add_argument('--output', help="Write results as JSON to this path")
+    parser.add_argument('--compare', help="Baseline JSON to compare p50 latencies against")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Allowed p50 slowdown before --compare fails")
+    args = parser.parse_args()
+
+    results, model_version = run(sorted(args.scales), args.ops, args.repeat_factor, args.registry, args.data_dir)
+    report = {
+        'meta': {'timestamp': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': git_commit(),
+                 'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+                 'platform': platform.platform(), 'cpu_count': os.cpu_count(), 'models': model_version},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} operation(s) slower than the baseline by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
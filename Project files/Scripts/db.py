@@ -0,0 +1,84 @@
+import sqlite3
+from contextlib import contextmanager
+
+import pandas as pd
+
+from metrics import DB_QUERY, count_query, timed
+
+DATABASE = 'BigBasket.db'
+
+
+@contextmanager
+def get_db_connection(database=DATABASE):
+    conn = sqlite3.connect(database)
+    conn.set_trace_callback(count_query)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def read_table(table_name, database=DATABASE):
+    with timed(DB_QUERY, table=table_name), get_db_connection(database) as conn:
+        return pd.read_sql(f"SELECT * FROM {table_name}", conn)
+
+
+def catalog_version(database=DATABASE):
+    # Bumped by each bulk catalogue ingestion; 0 until the first one.
+    with get_db_connection(database) as conn:
+        try:
+            return conn.execute("SELECT MAX(version) FROM CatalogUpdates").fetchone()[0] or 0
+        except sqlite3.OperationalError:
+            return 0
+
+
+def max_rowid(table_name, database=DATABASE):
+    # A cheap change check for tables the app only appends to, such as Orders.
+    with get_db_connection(database) as conn:
+        return conn.execute(f"SELECT MAX(rowid) FROM {table_name}").fetchone()[0]
+
+
+def read_customer_orders(customer_id, database=DATABASE):
+    with timed(DB_QUERY, table='Orders', by='CustomerID'), get_db_connection(database) as conn:
+        return pd.read_sql("SELECT * FROM Orders WHERE CustomerID = ?", conn, params=(customer_id,))
+
+
+def ensure_indexes(database=DATABASE):
+    # Per-customer and per-day lookups would otherwise scan the whole Orders table.
+    with get_db_connection(database) as conn:
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_customer ON Orders (CustomerID)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_date ON Orders (OrderDate)")
+        conn.commit()
+
+
+def orders_watermark(database=DATABASE):
+    # Orders are only ever appended, so the newest rowid marks how far a model has read. The
+    # row's contents are kept too, so a rebuilt table that reuses rowids is noticed.
+    with get_db_connection(database) as conn:
+        row = conn.execute("SELECT rowid, CustomerID, OrderID, ProductName FROM Orders ORDER BY rowid DESC LIMIT 1").fetchone()
+    return None if row is None else {'rowid': row[0], 'row': list(row[1:])}
+
+
+def watermark_matches(watermark, database=DATABASE):
+    with get_db_connection(database) as conn:
+        row = conn.execute("SELECT CustomerID, OrderID, ProductName FROM Orders WHERE rowid = ?", (watermark['rowid'],)).fetchone()
+    return row is not None and list(row) == watermark['row']
+
+
+def read_orders(after_rowid=0, upto_rowid=None, database=DATABASE):
+    with timed(DB_QUERY, table='Orders', by='rowid'), get_db_connection(database) as conn:
+        if upto_rowid is None:
+            return pd.read_sql("SELECT * FROM Orders WHERE rowid > ?", conn, params=(after_rowid,))
+        return pd.read_sql("SELECT * FROM Orders WHERE rowid > ? AND rowid <= ?", conn, params=(after_rowid, upto_rowid))
+
+
+def read_orders_for(column, values, database=DATABASE):
+    # All order lines whose column is one of values, e.g. every order of the given customers.
+    values = list(values)
+    frames = []
+    with timed(DB_QUERY, table='Orders', by=column), get_db_connection(database) as conn:
+        # SQLite caps the number of bound parameters per statement.
+        for start in range(0, len(values), 900):
+            batch = values[start:start + 900]
+            frames.append(pd.read_sql(f"SELECT * FROM Orders WHERE {column} IN ({', '.join('?' * len(batch))})", conn, params=batch))
+    return pd.concat(frames, ignore_index=True) if frames else read_orders(0, 0, database)
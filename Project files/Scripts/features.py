@@ -0,0 +1,99 @@
+import pandas as pd
+
+from metrics import FEATURES, instrument
+
+DATE_FORMAT = '%d/%m/%Y'
+DEMAND_FEATURES = ['ProductName', 'Brand', 'Price_order', 'DiscountPrice', 'Category', 'SubCategory',
+                   'OrderDay', 'OrderMonth', 'PriceDiff', 'Price_Discount_Interaction',
+                   'Lag_Quantity_1', 'Lag_Quantity_2', 'Lag_Quantity_3', 'Rolling_Mean_3']
+ENCODED_COLUMNS = ['ProductName', 'Brand', 'Category', 'SubCategory']
+
+
+def parse_order_dates(order_dates):
+    if pd.api.types.is_datetime64_any_dtype(order_dates):
+        return order_dates
+    return pd.to_datetime(order_dates, format=DATE_FORMAT)
+
+
+@instrument(FEATURES, step='customer_features')
+def customer_features(orders_df, product_ids):
+    # product_ids is aligned with orders_df rows. MostBoughtProduct is the
+    # most frequent ProductID per customer, ties going to the smallest ID
+    # (what Series.mode()[0] returns), without a Python call per group.
+    orders = pd.DataFrame({
+        'CustomerID': orders_df['CustomerID'].to_numpy(),
+        'OrderID': orders_df['OrderID'].to_numpy(),
+        'Quantity': orders_df['Quantity'].to_numpy(),
+        'ProductID': product_ids,
+    })
+    features = orders.groupby('CustomerID').agg(
+        TotalOrders=pd.NamedAgg(column='OrderID', aggfunc='nunique'),
+        AvgQuantity=pd.NamedAgg(column='Quantity', aggfunc='mean'),
+    )
+    counts = orders.groupby(['CustomerID', 'ProductID']).size().reset_index(name='count')
+    counts = counts.sort_values(['CustomerID', 'count', 'ProductID'], ascending=[True, False, True])
+    features['MostBoughtProduct'] = counts.drop_duplicates('CustomerID').set_index('CustomerID')['ProductID']
+    return features.reset_index()
+
+
+@instrument(FEATURES, step='recommender_frame')
+def recommender_frame(orders_df, product_ids, customer_features_df=None):
+    # One row per order line with the recommender's FEATURES and its Quantity target.
+    order_dates = parse_order_dates(orders_df['OrderDate'])
+    if customer_features_df is None:
+        customer_features_df = customer_features(orders_df, product_ids)
+    frame = pd.DataFrame({
+        'CustomerID': orders_df['CustomerID'].to_numpy(),
+        'OrderDate': order_dates.to_numpy(),
+        'ProductID': product_ids,
+        'Month': order_dates.dt.month.to_numpy(),
+        'DayOfWeek': order_dates.dt.dayofweek.to_numpy(),
+        'Quantity': orders_df['Quantity'].to_numpy(),
+    })
+    return frame.merge(customer_features_df, on='CustomerID', how='left')
+
+
+@instrument(FEATURES, step='demand_frame')
+def demand_frame(orders_df, products_df):
+    # Daily demand per product joined with catalogue data, plus the lag features.
+    orders = orders_df[['ProductName', 'OrderDate', 'Quantity', 'Price']].copy()
+    orders['OrderDate'] = parse_order_dates(orders['OrderDate'])
+    daily_demand_df = orders.groupby(['ProductName', 'OrderDate']).agg({
+        'Quantity': 'sum',
+        'Price': 'mean'
+    }).reset_index()
+    merged_df = pd.merge(daily_demand_df, products_df, on='ProductName', how='left', suffixes=('_order', '_product'))
+    merged_df['DiscountPrice'] = merged_df['DiscountPrice'].fillna(0)
+    merged_df['Price_order'] = merged_df['Price_order'].fillna(0)
+    merged_df['Price_product'] = merged_df['Price_product'].fillna(0)
+    merged_df['PriceDiff'] = merged_df['Price_order'] - merged_df['DiscountPrice']
+    if 'Quantity' not in merged_df.columns:
+        merged_df['Quantity'] = merged_df['Quantity_order'].fillna(0)
+    merged_df['OrderDay'] = merged_df['OrderDate'].dt.day
+    merged_df['OrderMonth'] = merged_df['OrderDate'].dt.month
+    merged_df['Price_Discount_Interaction'] = merged_df['Price_order'] * merged_df['DiscountPrice']
+    quantity_by_product = merged_df.groupby('ProductName')['Quantity']
+    lags = [quantity_by_product.shift(lag) for lag in (1, 2, 3)]
+    merged_df['Lag_Quantity_1'] = lags[0].fillna(0)
+    merged_df['Lag_Quantity_2'] = lags[1].fillna(0)
+    merged_df['Lag_Quantity_3'] = lags[2].fillna(0)
+    # Mean of the previous three days, i.e. shift(1).rolling(3).mean() within each product.
+    merged_df['Rolling_Mean_3'] = ((lags[0] + lags[1] + lags[2]) / 3).fillna(0)
+    return merged_df
+
+
+@instrument(FEATURES, step='encode_demand_features')
+def encode_demand_features(merged_df, encoding=None):
+    # Label-encodes the categorical columns in place and returns the standardised feature matrix
+    # with the encoding used: label encoders and a scaler, fitted on merged_df unless given.
+    # Models keep the encoding they were trained with, so serving and refreshes reuse it; labels
+    # it has not seen, such as products added since, are encoded as -1.
+    from sklearn.preprocessing import LabelEncoder, StandardScaler
+    fit = encoding is None
+    if fit:
+        encoding = {'label_encoders': {column: LabelEncoder().fit(merged_df[column]) for column in ENCODED_COLUMNS}}
+    for column, le in encoding['label_encoders'].items():
+        merged_df[column] = pd.Index(le.classes_).get_indexer(merged_df[column])
+    if fit:
+        encoding['scaler'] = StandardScaler().fit(merged_df[DEMAND_FEATURES])
+    return encoding['scaler'].transform(merged_df[DEMAND_FEATURES]), encoding
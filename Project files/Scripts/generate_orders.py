@@ -0,0 +1,196 @@
+import argparse
+import os
+import resource
+import sqlite3
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from db import get_db_connection
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Data files')
+ORDER_COLUMNS = ['CustomerID', 'OrderID', 'ProductName', 'Quantity', 'OrderDate', 'Price']
+DATE_FORMAT = '%d/%m/%Y'
+
+
+def load_catalog(catalog_size=None, path=os.path.join(DATA_DIR, 'ProductsOnWebsite.csv')):
+    products_df = pd.read_csv(path).drop_duplicates(subset='ProductName', keep='first').reset_index(drop=True)
+    if catalog_size is None or catalog_size == len(products_df):
+        return products_df
+    if catalog_size < len(products_df):
+        return products_df.iloc[:catalog_size].reset_index(drop=True)
+    # Larger catalogues repeat the real products as numbered variants.
+    copies = -(-catalog_size // len(products_df))
+    variants = pd.concat([products_df] * copies, ignore_index=True).iloc[:catalog_size]
+    variant_number = np.arange(catalog_size) // len(products_df)
+    variants['ProductName'] = np.where(variant_number == 0, variants['ProductName'],
+                                       variants['ProductName'] + ' #' + variant_number.astype(str))
+    return variants
+
+
+def popularity(n_products, skew, rng):
+    # Zipf-like weights over a random ranking of the catalogue; skew=0 is uniform.
+    ranks = rng.permutation(n_products) + 1
+    weights = ranks.astype(np.float64) ** -skew
+    return np.cumsum(weights / weights.sum())
+
+
+def day_weights(days, seasonality):
+    # Yearly cycle peaking in late December; seasonality=0 spreads orders evenly.
+    phase = 2 * np.pi * (days.dayofyear.to_numpy() - 356) / 365.25
+    weights = 1 + seasonality * np.cos(phase)
+    return np.cumsum(weights / weights.sum())
+
+
+class OrderGenerator:
+    def __init__(self, products_df, customers=1000, orders_per_customer=60, items_per_order=(8, 20), quantity=(1, 5),
+                 start=None, end=None, seasonality=0.0, skew=0.0, seed=42):
+        self.rng = np.random.default_rng(seed)
+        self.customers = customers
+        self.orders_per_customer = orders_per_customer
+        self.items_per_order = items_per_order
+        self.quantity = quantity
+        self.product_names = products_df['ProductName'].to_numpy(dtype=object)
+        self.product_prices = products_df['DiscountPrice'].to_numpy(dtype=np.float64)
+        self.product_cdf = popularity(len(products_df), skew, self.rng)
+        end = pd.Timestamp(end) if end is not None else pd.Timestamp('today').normalize()
+        start = pd.Timestamp(start) if start is not None else end - pd.DateOffset(years=1)
+        days = pd.date_range(start, end, freq='D')
+        self.day_strings = days.strftime(DATE_FORMAT).to_numpy(dtype=object)
+        self.day_cdf = day_weights(days, seasonality)
+
+    @property
+    def expected_lines(self):
+        low, high = self.items_per_order
+        return self.customers * self.orders_per_customer * (low + high) / 2
+
+    def _sample(self, cdf, size):
+        return np.minimum(np.searchsorted(cdf, self.rng.random(size), side='right'), len(cdf) - 1)
+
+    def chunk(self, first_customer, n_customers):
+        opc = self.orders_per_customer
+        n_orders = n_customers * opc
+        customer_numbers = np.repeat(np.arange(first_customer, first_customer + n_customers), opc)
+        order_numbers = np.tile(np.arange(1, opc + 1), n_customers)
+        # Each customer's orders are numbered in date order.
+        order_days = self._sample(self.day_cdf, n_orders).reshape(n_customers, opc)
+        order_days.sort(axis=1)
+        order_days = order_days.ravel()
+
+        customer_ids = np.char.add('c', customer_numbers.astype(str)).astype(object)
+        order_ids = np.char.add(np.char.add(customer_ids.astype(str), '-'), order_numbers.astype(str)).astype(object)
+        low, high = self.items_per_order
+        items = self.rng.integers(low, high + 1, size=n_orders)
+        line_order = np.repeat(np.arange(n_orders), items)
+        products = self._sample(self.product_cdf, len(line_order))
+        quantities = self.rng.integers(self.quantity[0], self.quantity[1] + 1, size=len(line_order))
+        return pd.DataFrame({
+            'CustomerID': customer_ids[line_order],
+            'OrderID': order_ids[line_order],
+            'ProductName': self.product_names[products],
+            'Quantity': quantities,
+            'OrderDate': self.day_strings[order_days][line_order],
+            'Price': self.product_prices[products] * quantities,
+        })
+
+    def chunks(self, customers_per_chunk):
+        for first in range(1, self.customers + 1, customers_per_chunk):
+            yield self.chunk(first, min(customers_per_chunk, self.customers - first + 1))
+
+
+class SQLiteSink:
+    def __init__(self, path, products_df, customers, replace=False):
+        self.path = path
+        with get_db_connection(path) as conn:
+            if replace:
+                conn.execute("DROP TABLE IF EXISTS Orders")
+            elif conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='Orders'").fetchone() \
+                    and conn.execute("SELECT 1 FROM Orders LIMIT 1").fetchone():
+                # Generated ids (c1, c1-1, ...) are the same form as the real ones, so appending would
+                # add lines to existing customers' orders.
+                raise ValueError(f"{path} already has orders; use --replace or a new database")
+            conn.execute("CREATE TABLE IF NOT EXISTS Orders (CustomerID TEXT, OrderID TEXT, ProductName TEXT, "
+                         "Quantity INTEGER, OrderDate TEXT, Price REAL)")
+            tables = {row[0].lower() for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+            # Reference tables are only created when missing, so generating into a real database leaves them alone.
+            if 'productsonwebsite' not in tables:
+                products_df.to_sql('ProductsOnWebsite', conn, index=False)
+            if 'customers' not in tables:
+                pd.DataFrame({'name': [f'c{i}' for i in range(1, customers + 1)], 'password': 'cus'}).to_sql('customers', conn, index=False)
+            if 'managers' not in tables:
+                pd.read_csv(os.path.join(DATA_DIR, 'managers.csv')).to_sql('managers', conn, index=False)
+            conn.commit()
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+
+    def write(self, chunk):
+        with self.conn:
+            self.conn.executemany("INSERT INTO Orders (CustomerID, OrderID, ProductName, Quantity, OrderDate, Price) VALUES (?, ?, ?, ?, ?, ?)",
+                                  zip(*(chunk[column].tolist() for column in ORDER_COLUMNS)))
+
+    def close(self):
+        with self.conn:
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_customer ON Orders (CustomerID)")
+        self.conn.close()
+
+
+class ParquetSink:
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa = pa
+        self.schema = pa.schema([('CustomerID', pa.string()), ('OrderID', pa.string()), ('ProductName', pa.string()),
+                                 ('Quantity', pa.int64()), ('OrderDate', pa.string()), ('Price', pa.float64())])
+        self.writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+
+    def write(self, chunk):
+        self.writer.write_table(self.pa.Table.from_pandas(chunk, schema=self.schema, preserve_index=False))
+
+    def close(self):
+        self.writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic orders into a SQLite database or a Parquet file.")
+    parser.add_argument('output', help="Target .db (SQLite, Orders table) or .parquet file")
+    parser.add_argument('--customers', type=int, default=1000)
+    parser.add_argument('--orders-per-customer', type=int, default=60)
+    parser.add_argument('--items-per-order', type=int, nargs=2, default=[8, 20], metavar=('MIN', 'MAX'))
+    parser.add_argument('--catalog-size', type=int, help="Number of products (default: the whole catalogue)")
+    parser.add_argument('--seasonality', type=float, default=0.0, help="Amplitude of the yearly cycle, 0 to 1")
+    parser.add_argument('--skew', type=float, default=0.0, help="Zipf exponent of product popularity, 0 is uniform")
+    parser.add_argument('--start', help="First order date, YYYY-MM-DD (default: one year before --end)")
+    parser.add_argument('--end', help="Last order date, YYYY-MM-DD (default: today)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chunk-customers', type=int, default=2000, help="Customers generated per chunk")
+    parser.add_argument('--replace', action='store_true', help="Drop the existing Orders table first; required if it has orders")
+    args = parser.parse_args()
+
+    products_df = load_catalog(args.catalog_size)
+    generator = OrderGenerator(products_df, args.customers, args.orders_per_customer, tuple(args.items_per_order),
+                               start=args.start, end=args.end, seasonality=args.seasonality, skew=args.skew, seed=args.seed)
+    if args.output.endswith('.parquet'):
+        sink = ParquetSink(args.output)
+    else:
+        try:
+            sink = SQLiteSink(args.output, products_df, args.customers, replace=args.replace)
+        except ValueError as error:
+            sys.exit(str(error))
+    print(f"Generating ~{generator.expected_lines:,.0f} order lines for {args.customers:,} customers "
+          f"over {len(products_df):,} products into {args.output}")
+    start = time.perf_counter()
+    lines = 0
+    for chunk in generator.chunks(args.chunk_customers):
+        sink.write(chunk)
+        lines += len(chunk)
+    sink.close()
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Wrote {lines:,} lines in {elapsed:.1f}s ({lines / elapsed:,.0f} lines/s), peak RSS {peak_mb:.0f} MB")
+
+
+if __name__ == '__main__':
+    main()
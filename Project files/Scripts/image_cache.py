@@ -0,0 +1,159 @@
+import hashlib
+import io
+import os
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+from PIL import Image
+
+THUMBNAIL_SIZE = 300
+CACHE_DIR = 'image_cache'
+MAX_CACHE_BYTES = 200 * 1024 * 1024
+# A page waits this long in total for its missing thumbnails; the rest keep downloading
+# in the background and are shown from their remote URLs until they are cached.
+FETCH_DEADLINE = 2.0
+# URLs that failed are served remotely for this long before they are tried again.
+FAILURE_TTL = 300.0
+
+
+def http_fetcher(url, timeout=10):
+    request = urllib.request.Request(url, headers={'User-Agent': 'FreshMarket/1.0'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read()
+
+
+def local_fetcher(directory):
+    # Offline stand-in: serves each URL from a file named after its last path segment.
+    def fetch(url):
+        with open(os.path.join(directory, url.rstrip('/').rsplit('/', 1)[-1]), 'rb') as f:
+            return f.read()
+    return fetch
+
+
+def make_thumbnail(data, size):
+    image = Image.open(io.BytesIO(data))
+    image.thumbnail((size, size))
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    out = io.BytesIO()
+    image.save(out, format='JPEG', quality=85, optimize=True)
+    return out.getvalue()
+
+
+class ThumbnailCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES, fetcher=http_fetcher, fetch_workers=8,
+                 deadline=FETCH_DEADLINE, failure_ttl=FAILURE_TTL):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.fetcher = fetcher
+        self.deadline = deadline
+        self.failure_ttl = failure_ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._pending = {}
+        self._failed = {}
+        self._executor = ThreadPoolExecutor(max_workers=fetch_workers, thread_name_prefix='thumbnail-fetch')
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.jpg'):
+                path = os.path.join(self.cache_dir, name)
+                stat = os.stat(path)
+                files.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._total_bytes += size
+        with self._lock:
+            self._evict()
+
+    def _key(self, url, size):
+        return hashlib.sha1(f'{size}:{url}'.encode('utf-8')).hexdigest() + '.jpg'
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+
+    def _touch(self, name):
+        self._entries.move_to_end(name)
+        try:
+            os.utime(os.path.join(self.cache_dir, name))
+        except FileNotFoundError:
+            pass
+
+    def _store(self, name, data):
+        path = os.path.join(self.cache_dir, name)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._total_bytes += len(data) - self._entries.pop(name, 0)
+            self._entries[name] = len(data)
+            self._evict()
+        return path
+
+    def _fetch(self, url, size, name):
+        try:
+            return self._store(name, make_thumbnail(self.fetcher(url), size))
+        except Exception:
+            with self._lock:
+                self._failed[name] = time.monotonic() + self.failure_ttl
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(name, None)
+
+    def _lookup(self, url, size):
+        # The cached path, the URL itself if it is not worth fetching now, or the download's future.
+        if not isinstance(url, str) or not url:
+            return url
+        name = self._key(url, size)
+        with self._lock:
+            if name in self._entries:
+                self._touch(name)
+                return os.path.join(self.cache_dir, name)
+            if self._failed.get(name, 0) > time.monotonic():
+                return url
+            self._failed.pop(name, None)
+            future = self._pending.get(name)
+            if future is None:
+                future = self._pending[name] = self._executor.submit(self._fetch, url, size, name)
+            return future
+
+    def get_many(self, urls, size=THUMBNAIL_SIZE):
+        # Paths for urls, in order. Misses download in parallel and the call waits at most
+        # self.deadline for them; anything still missing is returned as its remote URL.
+        items = [self._lookup(url, size) for url in urls]
+        futures = [item for item in items if isinstance(item, Future)]
+        if futures:
+            wait(futures, timeout=self.deadline)
+        paths = []
+        for url, item in zip(urls, items):
+            if isinstance(item, Future):
+                item = item.result() if item.done() and item.exception() is None else url
+            paths.append(item)
+        return paths
+
+    def get(self, url, size=THUMBNAIL_SIZE):
+        return self.get_many([url], size)[0]
+
+    def prefetch(self, urls, size=THUMBNAIL_SIZE):
+        for url in urls:
+            self._lookup(url, size)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._total_bytes, 'max_bytes': self.max_bytes,
+                    'pending': len(self._pending), 'failed': len(self._failed)}
@@ -0,0 +1,174 @@
+import argparse
+import datetime
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from db import DATABASE, get_db_connection
+from metrics import DB_WRITE, timed
+from operations import PRODUCT_COLUMNS, PRODUCT_TEXT_COLUMNS
+
+CATALOG_COLUMNS = ['ProductName', 'Brand', 'Price', 'DiscountPrice', 'Image_Url', 'Quantity', 'Category', 'SubCategory', 'Absolute_Url']
+KEY_COLUMNS = ['ProductName', 'Quantity']
+CHUNK_ROWS = 10000
+# Pack sizes such as "2 kg" or "12 pcs" must not start with zero; labels without a number ("Combo") are accepted.
+LEADING_AMOUNT = r'^\s*(\d*\.?\d+)'
+
+
+def read_chunks(path, chunk_rows):
+    # Everything is read as text so validation, not the CSV parser, decides what a bad price looks like.
+    reader = pd.read_csv(path, chunksize=chunk_rows, dtype=str, keep_default_na=False)
+    for chunk in reader:
+        missing = [column for column in PRODUCT_COLUMNS if column not in chunk.columns]
+        if missing:
+            raise ValueError(f"{path} is missing columns: {', '.join(missing)}")
+        yield chunk[[column for column in CATALOG_COLUMNS if column in chunk.columns]]
+
+
+def existing_products(database):
+    # (ProductName, Quantity) of every product already in the catalogue, empty if there is no catalogue yet.
+    with get_db_connection(database) as conn:
+        try:
+            rows = conn.execute("SELECT ProductName, Quantity FROM ProductsOnWebsite").fetchall()
+        except sqlite3.OperationalError:
+            rows = []
+    return pd.MultiIndex.from_tuples(rows, names=KEY_COLUMNS) if rows else pd.MultiIndex.from_arrays([[], []], names=KEY_COLUMNS)
+
+
+def validate(chunk, seen_names, existing):
+    # The manager form's checks, applied to a whole chunk: filled fields, prices of at least 0,
+    # http(s) URLs, a positive pack size and a product name that is not taken. A row may update
+    # a product already in the catalogue (existing), but not add another pack size under its
+    # name, and each name may appear only once in the feed, because carts look products up by name.
+    # Returns the valid rows and a Series with the first error of each rejected row.
+    for column in PRODUCT_TEXT_COLUMNS:
+        chunk[column] = chunk[column].str.strip()
+    errors = pd.Series('', index=chunk.index, dtype=object)
+
+    def reject(mask, message):
+        errors[mask & (errors == '')] = message
+
+    reject((chunk[PRODUCT_TEXT_COLUMNS] == '').any(axis=1), "All fields must be filled.")
+    for column in ('Price', 'DiscountPrice'):
+        values = pd.to_numeric(chunk[column], errors='coerce')
+        reject(~(values >= 0), f"{column} must be a number of at least 0.")
+        chunk[column] = values
+    urls_valid = chunk['Image_Url'].str.startswith(('http://', 'https://')) & chunk['Absolute_Url'].str.startswith(('http://', 'https://'))
+    reject(~urls_valid, "Please enter valid URLs starting with http:// or https://")
+    amounts = pd.to_numeric(chunk['Quantity'].str.extract(LEADING_AMOUNT, expand=False), errors='coerce')
+    reject(amounts <= 0, "Quantity must be a positive amount.")
+
+    is_update = pd.MultiIndex.from_frame(chunk[KEY_COLUMNS]).isin(existing)
+    reject(chunk['ProductName'].isin(existing.get_level_values('ProductName')) & ~is_update,
+           "Product name already exists. Please use a different name.")
+    duplicate = np.zeros(len(chunk), dtype=bool)
+    for i, (name, error) in enumerate(zip(chunk['ProductName'], errors.to_numpy())):
+        if error:
+            continue
+        if name in seen_names:
+            duplicate[i] = True
+        else:
+            seen_names.add(name)
+    reject(duplicate, "Product appears more than once in the feed.")
+    return chunk[errors == ''], errors[errors != '']
+
+
+class CatalogWriter:
+    # Upserts on (ProductName, Quantity), the key the manager pages edit and delete by,
+    # one short transaction per batch so the app's own reads and writes interleave.
+    def __init__(self, database, columns, wal=True):
+        self.columns = columns
+        self.conn = sqlite3.connect(database, timeout=30)
+        if wal:
+            # WAL lets shoppers keep reading while a batch commits; the mode persists in the database file.
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        # A new database gets the catalogue table cleaning.ipynb would have written.
+        column_types = ', '.join(f"{column} {'REAL' if column in ('Price', 'DiscountPrice') else 'TEXT'}" for column in CATALOG_COLUMNS)
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS ProductsOnWebsite ({column_types})")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_products_key ON ProductsOnWebsite (ProductName, Quantity)")
+        self.conn.execute(f"CREATE TEMP TABLE catalog_staging ({', '.join(columns)})")
+        updates = ', '.join(f"{column} = s.{column}" for column in columns if column not in KEY_COLUMNS)
+        match = ' AND '.join(f"p.{column} = s.{column}" for column in KEY_COLUMNS)
+        column_list = ', '.join(columns)
+        self.update_sql = f"UPDATE ProductsOnWebsite AS p SET {updates} FROM catalog_staging AS s WHERE {match}"
+        self.insert_sql = (f"INSERT INTO ProductsOnWebsite ({column_list}) SELECT {column_list} FROM catalog_staging AS s "
+                           f"WHERE NOT EXISTS (SELECT 1 FROM ProductsOnWebsite AS p WHERE {match})")
+        self.inserted = 0
+        self.updated = 0
+
+    def write(self, rows):
+        with timed(DB_WRITE, operation='ingest_catalog'), self.conn:
+            self.conn.execute("DELETE FROM catalog_staging")
+            self.conn.executemany(f"INSERT INTO catalog_staging VALUES ({', '.join('?' * len(self.columns))})",
+                                  zip(*(rows[column].tolist() for column in self.columns)))
+            self.updated += self.conn.execute(self.update_sql).rowcount
+            self.inserted += self.conn.execute(self.insert_sql).rowcount
+
+    def finish(self, source, rejected):
+        # Recording the run bumps the catalogue version, which is what tells running app
+        # sessions to reload their product list; that happens once, after the last batch.
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS CatalogUpdates (version INTEGER PRIMARY KEY AUTOINCREMENT, "
+                              "source TEXT, finished_at TEXT, inserted INTEGER, updated INTEGER, rejected INTEGER)")
+            cursor = self.conn.execute("INSERT INTO CatalogUpdates (source, finished_at, inserted, updated, rejected) VALUES (?, ?, ?, ?, ?)",
+                                       (source, datetime.datetime.now().isoformat(timespec='seconds'), self.inserted, self.updated, rejected))
+        self.conn.execute("PRAGMA optimize")
+        self.conn.close()
+        return cursor.lastrowid
+
+
+def ingest(path, database=DATABASE, chunk_rows=CHUNK_ROWS, dry_run=False, rejects_path=None, wal=True):
+    start = time.perf_counter()
+    seen_names = set()
+    existing = existing_products(database)
+    writer = None
+    report = {'read': 0, 'valid': 0, 'rejected': 0, 'reasons': {}}
+    if rejects_path and os.path.exists(rejects_path):
+        os.remove(rejects_path)
+    for chunk in read_chunks(path, chunk_rows):
+        report['read'] += len(chunk)
+        rows, errors = validate(chunk.copy(), seen_names, existing)
+        report['valid'] += len(rows)
+        report['rejected'] += len(errors)
+        for reason, count in errors.value_counts().items():
+            report['reasons'][reason] = report['reasons'].get(reason, 0) + int(count)
+        if rejects_path and len(errors):
+            rejected = chunk.loc[errors.index].assign(Error=errors)
+            rejected.to_csv(rejects_path, mode='a', header=not os.path.exists(rejects_path), index=False)
+        if dry_run or rows.empty:
+            continue
+        if writer is None:
+            writer = CatalogWriter(database, list(rows.columns), wal)
+        writer.write(rows)
+    if writer is not None:
+        report['inserted'], report['updated'] = writer.inserted, writer.updated
+        report['catalog_version'] = writer.finish(os.path.abspath(path), report['rejected'])
+    report['seconds'] = time.perf_counter() - start
+    report['rows_per_second'] = report['read'] / report['seconds'] if report['seconds'] else 0.0
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate a catalogue CSV and upsert it into ProductsOnWebsite in batches.")
+    parser.add_argument('csv', help="Catalogue CSV with the ProductsOnWebsite columns, e.g. BigBasketProducts.csv")
+    parser.add_argument('--database', default=DATABASE)
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help="Rows read, validated and committed per batch")
+    parser.add_argument('--rejects', help="Write rejected rows, with the reason, to this CSV")
+    parser.add_argument('--dry-run', action='store_true', help="Validate only, without touching the database")
+    parser.add_argument('--no-wal', action='store_true', help="Leave the database's journal mode unchanged")
+    args = parser.parse_args()
+
+    report = ingest(args.csv, args.database, args.chunk_rows, args.dry_run, args.rejects, wal=not args.no_wal)
+    print(f"Read {report['read']:,} rows in {report['seconds']:.1f}s ({report['rows_per_second']:,.0f} rows/s): "
+          f"{report['valid']:,} valid, {report['rejected']:,} rejected")
+    for reason, count in sorted(report['reasons'].items(), key=lambda item: -item[1]):
+        print(f"  {count:>8,}  {reason}")
+    if 'inserted' in report:
+        print(f"Inserted {report['inserted']:,}, updated {report['updated']:,}; catalogue version {report['catalog_version']}")
+
+
+if __name__ == '__main__':
+    main()
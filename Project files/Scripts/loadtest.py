@@ -0,0 +1,178 @@
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+import numpy as np
+
+from db import DATABASE, get_db_connection
+
+SCENARIOS = ['browse', 'recommend', 'checkout']
+SERVICE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'service.py')
+
+
+class Client:
+    # One keep-alive connection per load-generating thread.
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.conn = None
+
+    def request(self, method, path, body=None):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        try:
+            self.conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+            response = self.conn.getresponse()
+            payload = response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = None
+            raise
+        return response.status, payload
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+
+def load_test_data(client, database, max_customers=10000):
+    status, payload = client.request('GET', '/categories')
+    categories = json.loads(payload)
+    status, payload = client.request('GET', '/products?per_page=500')
+    product_names = [item['ProductName'] for item in json.loads(payload)['items']]
+    words = sorted({word.lower() for name in product_names for word in name.split() if len(word) > 3})
+    with get_db_connection(database) as conn:
+        customers = [row[0] for row in conn.execute("SELECT DISTINCT CustomerID FROM Orders LIMIT ?", (max_customers,))]
+    if not customers:
+        sys.exit(f"No customers with orders in {database}")
+    return {'categories': categories, 'product_names': product_names, 'words': words, 'customers': customers}
+
+
+def make_request(scenario, data, rng):
+    if scenario == 'browse':
+        params = {'category': rng.choice(data['categories'])} if rng.random() < 0.5 else {'q': rng.choice(data['words'])}
+        return 'GET', '/products?' + urllib.parse.urlencode(params), None
+    customer = urllib.parse.quote(str(rng.choice(data['customers'])), safe='')
+    if scenario == 'recommend':
+        return 'GET', f'/customers/{customer}/recommendations?k=10', None
+    cart = rng.choice(data['product_names'], size=rng.integers(3, 15)).tolist()
+    return 'POST', f'/customers/{customer}/orders', {'cart': cart}
+
+
+def run_scenario(host, port, scenario, data, concurrency, duration, seed=0):
+    latencies, failures = [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(worker_id):
+        rng = np.random.default_rng([seed, worker_id])
+        client = Client(host, port)
+        local_latencies, local_failures = [], 0
+        while time.perf_counter() < deadline:
+            method, path, body = make_request(scenario, data, rng)
+            start = time.perf_counter()
+            try:
+                status, _ = client.request(method, path, body)
+                ok = status < 400
+            except (OSError, http.client.HTTPException):
+                ok = False
+            if ok:
+                local_latencies.append(time.perf_counter() - start)
+            else:
+                local_failures += 1
+        client.close()
+        with lock:
+            latencies.extend(local_latencies)
+            failures.append(local_failures)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies_ms = np.asarray(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        'requests': len(latencies),
+        'errors': sum(failures),
+        'rps': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p95_ms': float(np.percentile(latencies_ms, 95)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+    }
+
+
+def wait_until_ready(host, port, process, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"service.py exited with code {process.returncode}")
+        try:
+            if Client(host, port).request('GET', '/health')[0] == 200:
+                return
+        except (OSError, http.client.HTTPException):
+            time.sleep(0.5)
+    sys.exit("service.py did not become ready in time")
+
+
+def start_service(database, host, port, workers):
+    process = subprocess.Popen([sys.executable, SERVICE, '--database', database, '--host', host, '--port', str(port),
+                                '--workers', str(workers)])
+    wait_until_ready(host, port, process)
+    return process
+
+
+def run(args, host, port, workers=None):
+    client = Client(host, port)
+    data = load_test_data(client, args.database)
+    # One untimed request per scenario loads the models and caches in the worker that serves it.
+    for scenario in args.scenarios:
+        client.request(*make_request(scenario, data, np.random.default_rng(0)))
+    client.close()
+    results = {}
+    for scenario in args.scenarios:
+        results[scenario] = stats = run_scenario(host, port, scenario, data, args.concurrency, args.duration)
+        label = f"{workers} worker(s) " if workers else ""
+        print(f"{label}{scenario:<10} {stats['rps']:>8.1f} req/s  p50 {stats['p50_ms']:>7.1f}ms  p95 {stats['p95_ms']:>7.1f}ms  "
+              f"p99 {stats['p99_ms']:>7.1f}ms  errors {stats['errors']}", flush=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the service API and report requests/sec per scenario. "
+                                                 "The checkout scenario places real orders, so point it at a scratch database.")
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help="Service to test when --workers is not given")
+    parser.add_argument('--database', default=DATABASE, help="Database the service uses, for sampling customers")
+    parser.add_argument('--workers', type=int, nargs='+', help="Start service.py with each of these worker counts in turn")
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--concurrency', type=int, default=16, help="Concurrent client connections")
+    parser.add_argument('--duration', type=float, default=20.0, help="Seconds per scenario")
+    parser.add_argument('--output', help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    url = urllib.parse.urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    report = {'concurrency': args.concurrency, 'duration': args.duration, 'cpu_count': os.cpu_count(), 'results': {}}
+    if not args.workers:
+        report['results']['external'] = run(args, host, port)
+    for workers in args.workers or []:
+        process = start_service(args.database, host, port, workers)
+        try:
+            report['results'][str(workers)] = run(args, host, port, workers)
+        finally:
+            process.terminate()
+            process.wait()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
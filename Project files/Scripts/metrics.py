@@ -0,0 +1,201 @@
+import bisect
+import functools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = 'fresh_market_'
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+logger = logging.getLogger(__name__)
+
+
+def _label_key(labels):
+    # Label values are stored as text, so a None page or a numeric status sorts with the rest.
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = PREFIX + name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            series['counts'][bisect.bisect_left(self.buckets, value)] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def series(self):
+        with self._lock:
+            return {key: {'counts': list(s['counts']), 'sum': s['sum'], 'count': s['count']} for key, s in self._series.items()}
+
+    def quantile(self, q, **labels):
+        # Estimated from the buckets, interpolating linearly inside the bucket that holds the quantile.
+        series = self.series().get(_label_key(labels))
+        if not series or not series['count']:
+            return None
+        rank = q * series['count']
+        cumulative = 0
+        for i, count in enumerate(series['counts']):
+            if cumulative + count >= rank and count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+
+DB_QUERY = Histogram('db_query_seconds', "Time spent reading a table with read_table().")
+DB_WRITE = Histogram('db_write_seconds', "Time spent in a database write, by operation.")
+FEATURES = Histogram('feature_seconds', "Time spent building model features, by step.")
+INFERENCE = Histogram('model_inference_seconds', "Time spent in model prediction, by model.")
+PAGE_RENDER = Histogram('page_render_seconds', "Wall-clock time of one Streamlit rerun, by page.")
+QUERIES_PER_RERUN = Histogram('queries_per_rerun', "SQL statements executed during one Streamlit rerun, by page.", COUNT_BUCKETS)
+API_REQUEST = Histogram('api_request_seconds', "Time spent serving one service API request, by route, method and status.")
+HISTOGRAMS = [DB_QUERY, DB_WRITE, FEATURES, INFERENCE, PAGE_RENDER, QUERIES_PER_RERUN, API_REQUEST]
+
+_rerun = threading.local()
+
+
+@contextmanager
+def timed(histogram, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
+
+
+def instrument(histogram, **labels):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(histogram, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count_query(_statement=None):
+    # Used as the sqlite3 trace callback, so it sees every statement on the current thread.
+    if getattr(_rerun, 'queries', None) is not None:
+        _rerun.queries += 1
+
+
+@contextmanager
+def rerun(page):
+    # Times one script rerun and counts the SQL statements it executes; the
+    # yielded dict is filled in when the rerun ends.
+    stats = {'page': page}
+    _rerun.queries = 0
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats['seconds'] = time.perf_counter() - start
+        stats['queries'], _rerun.queries = _rerun.queries, None
+        PAGE_RENDER.observe(stats['seconds'], page=page)
+        QUERIES_PER_RERUN.observe(stats['queries'], page=page)
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_bound(bound):
+    return repr(float(bound))
+
+
+def render_prometheus():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.append(f'# HELP {histogram.name} {histogram.help_text}')
+        lines.append(f'# TYPE {histogram.name} histogram')
+        for labels, series in sorted(histogram.series().items(), key=lambda item: item[0]):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, series['counts']):
+                cumulative += count
+                lines.append(f'{histogram.name}_bucket{_format_labels(labels, [("le", _format_bound(bound))])} {cumulative}')
+            lines.append(f'{histogram.name}_bucket{_format_labels(labels, [("le", "+Inf")])} {series["count"]}')
+            lines.append(f'{histogram.name}_sum{_format_labels(labels)} {series["sum"]}')
+            lines.append(f'{histogram.name}_count{_format_labels(labels)} {series["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_textfile(path):
+    # Atomic replace, as the node_exporter textfile collector expects.
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_failed = False
+_server_lock = threading.Lock()
+
+
+def start_http_server(port, host='127.0.0.1'):
+    # Serves /metrics once per process; later calls return the running server. If the port
+    # cannot be bound the exporter stays off for the life of the process and None is returned.
+    global _server, _server_failed
+    with _server_lock:
+        if _server is None and not _server_failed:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                _server_failed = True
+                logger.warning("Metrics exporter disabled: cannot listen on %s:%s (%s)", host, port, e)
+                return None
+            threading.Thread(target=_server.serve_forever, name='metrics-http', daemon=True).start()
+    return _server
+
+
+def summary_rows():
+    rows = []
+    for histogram in HISTOGRAMS:
+        for labels, series in sorted(histogram.series().items(), key=lambda item: item[0]):
+            if not series['count']:
+                continue
+            label_dict = dict(labels)
+            rows.append({
+                'metric': histogram.name[len(PREFIX):],
+                'labels': ', '.join(f'{k}={v}' for k, v in labels),
+                'count': series['count'],
+                'mean': series['sum'] / series['count'],
+                'p50': histogram.quantile(0.5, **label_dict),
+                'p95': histogram.quantile(0.95, **label_dict),
+            })
+    return rows
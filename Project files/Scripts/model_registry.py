@@ -0,0 +1,234 @@
+import argparse
+import datetime
+import json
+import os
+import pickle
+import shutil
+
+import numpy as np
+
+REGISTRY_DIR = 'model_registry'
+CURRENT_FILE = 'CURRENT'
+RECOMMENDER_FILE = 'xgb_model.json'
+DEMAND_FILE = 'demand_forest.joblib'
+ENCODER_FILE = 'label_encoder.pkl'
+DEMAND_ENCODING_FILE = 'demand_encoding.pkl'
+METADATA_FILE = 'metadata.json'
+
+
+class PackedForest:
+    # sklearn copies every tree into private buffers when unpickling, so a
+    # memory-mapped RandomForestRegressor is not shared between processes.
+    # PackedForest keeps the trees as flat arrays that stay memory-mapped and
+    # predicts from them directly. encoding holds the demand features' label encoders and
+    # scaler from training (features.encode_demand_features), or None if it was not kept.
+    def __init__(self, arrays, encoding=None):
+        self.roots = arrays['roots']
+        self.children_left = arrays['children_left']
+        self.children_right = arrays['children_right']
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.value = arrays['value']
+        self.n_features_in_ = int(arrays['n_features_in'])
+        self.encoding = encoding
+
+    @classmethod
+    def from_estimator(cls, forest):
+        roots, left, right, feature, threshold, value = [], [], [], [], [], []
+        offset = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            roots.append(offset)
+            left.append(np.where(tree.children_left == -1, -1, tree.children_left + offset))
+            right.append(np.where(tree.children_right == -1, -1, tree.children_right + offset))
+            feature.append(tree.feature)
+            threshold.append(tree.threshold)
+            value.append(tree.value[:, 0, 0])
+            offset += tree.node_count
+        return cls({
+            'roots': np.asarray(roots, dtype=np.int64),
+            'children_left': np.concatenate(left).astype(np.int64),
+            'children_right': np.concatenate(right).astype(np.int64),
+            'feature': np.concatenate(feature).astype(np.int64),
+            'threshold': np.concatenate(threshold).astype(np.float64),
+            'value': np.concatenate(value).astype(np.float64),
+            'n_features_in': np.int64(forest.n_features_in_),
+        }, getattr(forest, 'encoding', None))
+
+    def arrays(self):
+        return {
+            'roots': self.roots, 'children_left': self.children_left, 'children_right': self.children_right,
+            'feature': self.feature, 'threshold': self.threshold, 'value': self.value,
+            'n_features_in': np.int64(self.n_features_in_),
+        }
+
+    def extend(self, other, max_trees=None):
+        # Appends other's trees; beyond max_trees the oldest trees are dropped. Trees are
+        # stored one after another, so that is a slice from the first kept root.
+        offset = len(self.feature)
+        arrays = {
+            'roots': np.concatenate([self.roots, other.roots + offset]),
+            'children_left': np.concatenate([self.children_left, np.where(other.children_left == -1, -1, other.children_left + offset)]),
+            'children_right': np.concatenate([self.children_right, np.where(other.children_right == -1, -1, other.children_right + offset)]),
+            'feature': np.concatenate([self.feature, other.feature]),
+            'threshold': np.concatenate([self.threshold, other.threshold]),
+            'value': np.concatenate([self.value, other.value]),
+            'n_features_in': np.int64(self.n_features_in_),
+        }
+        if max_trees is not None and len(arrays['roots']) > max_trees:
+            first = arrays['roots'][-max_trees]
+            arrays['roots'] = arrays['roots'][-max_trees:] - first
+            for name in ('children_left', 'children_right'):
+                children = arrays[name][first:]
+                arrays[name] = np.where(children == -1, -1, children - first)
+            for name in ('feature', 'threshold', 'value'):
+                arrays[name] = arrays[name][first:]
+        return PackedForest(arrays, self.encoding)
+
+    def save(self, path):
+        # Uncompressed so joblib can memory-map every array on load.
+        import joblib
+        joblib.dump(self.arrays(), path)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        import joblib
+        return cls(joblib.load(path, mmap_mode=mmap_mode))
+
+    def predict(self, X):
+        # Same split rule as sklearn: features cast to float32, compared with <= threshold.
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_samples, n_features = X.shape
+        flat_X = X.ravel()
+        row_offsets = np.arange(n_samples, dtype=np.int64) * n_features
+        total = np.zeros(n_samples)
+        for root in self.roots:
+            node = np.full(n_samples, root, dtype=np.int64)
+            active = np.arange(n_samples)
+            while active.size:
+                current = node.take(active)
+                left = self.children_left.take(current)
+                internal = left != -1
+                if not internal.all():
+                    active, current, left = active[internal], current[internal], left[internal]
+                go_left = flat_X.take(row_offsets.take(active) + self.feature.take(current)) <= self.threshold.take(current)
+                node[active] = np.where(go_left, left, self.children_right.take(current))
+            total += self.value.take(node)
+        return total / len(self.roots)
+
+
+def version_dir(version, registry_dir=REGISTRY_DIR):
+    return os.path.join(registry_dir, version)
+
+
+def list_versions(registry_dir=REGISTRY_DIR):
+    if not os.path.isdir(registry_dir):
+        return []
+    return sorted(name for name in os.listdir(registry_dir)
+                  if os.path.isfile(os.path.join(registry_dir, name, METADATA_FILE)))
+
+
+def current_version(registry_dir=REGISTRY_DIR):
+    try:
+        with open(os.path.join(registry_dir, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def set_current(version, registry_dir=REGISTRY_DIR):
+    if version not in list_versions(registry_dir):
+        raise ValueError(f"Unknown model version: {version}")
+    pointer = os.path.join(registry_dir, CURRENT_FILE)
+    tmp_pointer = f'{pointer}.{os.getpid()}.tmp'
+    with open(tmp_pointer, 'w') as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_pointer, pointer)
+
+
+def publish(model, demand_model, le_product, registry_dir=REGISTRY_DIR, version=None, metadata=None, activate=True):
+    version = version or datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    target = version_dir(version, registry_dir)
+    if os.path.exists(target):
+        raise ValueError(f"Model version already exists: {version}")
+    os.makedirs(registry_dir, exist_ok=True)
+    staging = os.path.join(registry_dir, f'.{version}.tmp')
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    try:
+        model.save_model(os.path.join(staging, RECOMMENDER_FILE))
+        if not isinstance(demand_model, PackedForest):
+            demand_model = PackedForest.from_estimator(demand_model)
+        demand_model.save(os.path.join(staging, DEMAND_FILE))
+        if demand_model.encoding is not None:
+            with open(os.path.join(staging, DEMAND_ENCODING_FILE), 'wb') as f:
+                pickle.dump(demand_model.encoding, f)
+        with open(os.path.join(staging, ENCODER_FILE), 'wb') as f:
+            pickle.dump(le_product, f)
+        metadata = dict(metadata or {}, version=version, published_at=datetime.datetime.now().isoformat(timespec='seconds'))
+        with open(os.path.join(staging, METADATA_FILE), 'w') as f:
+            json.dump(metadata, f, indent=2)
+        os.rename(staging, target)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    if activate:
+        set_current(version, registry_dir)
+    return version
+
+
+def load_version(version, registry_dir=REGISTRY_DIR):
+    from xgboost import XGBRegressor
+    directory = version_dir(version, registry_dir)
+    model = XGBRegressor()
+    model.load_model(os.path.join(directory, RECOMMENDER_FILE))
+    demand_model = PackedForest.load(os.path.join(directory, DEMAND_FILE))
+    encoding_path = os.path.join(directory, DEMAND_ENCODING_FILE)
+    if os.path.exists(encoding_path):
+        with open(encoding_path, 'rb') as f:
+            demand_model.encoding = pickle.load(f)
+    with open(os.path.join(directory, ENCODER_FILE), 'rb') as f:
+        le_product = pickle.load(f)
+    return model, demand_model, le_product
+
+
+def read_metadata(version, registry_dir=REGISTRY_DIR):
+    with open(os.path.join(version_dir(version, registry_dir), METADATA_FILE)) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage versioned model artifacts for the Fresh Market app.")
+    parser.add_argument('--registry', default=REGISTRY_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+    publish_parser = commands.add_parser('publish', help="Import a recommender, demand model and label encoder as a new version")
+    publish_parser.add_argument('--recommender', default='xgb_model.json')
+    publish_parser.add_argument('--demand', default='best_random_forest_model_with_lags.pkl')
+    publish_parser.add_argument('--encoder', default='label_encoder.pkl')
+    publish_parser.add_argument('--version')
+    publish_parser.add_argument('--no-activate', action='store_true')
+    commands.add_parser('list', help="List published versions")
+    activate_parser = commands.add_parser('activate', help="Point the app at a published version")
+    activate_parser.add_argument('version')
+    args = parser.parse_args()
+
+    if args.command == 'publish':
+        from models import load_model
+        model, demand_model, le_product = load_model(args.recommender, args.demand, args.encoder)
+        version = publish(model, demand_model, le_product, args.registry, args.version,
+                          {'source': {'recommender': args.recommender, 'demand': args.demand, 'encoder': args.encoder}},
+                          activate=not args.no_activate)
+        print(f"Published {version}")
+    elif args.command == 'list':
+        current = current_version(args.registry)
+        for version in list_versions(args.registry):
+            print(f"{'*' if version == current else ' '} {version}")
+    elif args.command == 'activate':
+        set_current(args.version, args.registry)
+        print(f"Activated {args.version}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import pickle
+import threading
+
+import model_registry
+
+MODEL_PATH = "xgb_model.json"
+DEMAND_PATH = "best_random_forest_model_with_lags.pkl"
+ENCODER_PATH = "label_encoder.pkl"
+
+_lock = threading.Lock()
+_models = None
+_loaded_version = None
+_warm_thread = None
+
+
+class ModelsUnavailable(Exception):
+    pass
+
+
+def load_model(model_path, demand_path, encoder_path):
+    # xgboost, sklearn and joblib are imported here so the login page never pays for them.
+    from xgboost import XGBRegressor
+    import joblib
+    model = XGBRegressor()
+    model.load_model(model_path)
+    demand_model = joblib.load(open(demand_path, 'rb'))
+    with open(encoder_path, 'rb') as f:
+        le_product = pickle.load(f)
+    return model, demand_model, le_product
+
+
+def get_models():
+    # The registry pointer is re-read on every call so a newly activated
+    # version is picked up on the next rerun without restarting the server.
+    # Without a registry, the legacy artifacts next to the script are used.
+    global _models, _loaded_version
+    version = model_registry.current_version()
+    if _models is None or version != _loaded_version:
+        with _lock:
+            if _models is None or version != _loaded_version:
+                try:
+                    if version is None:
+                        _models = load_model(MODEL_PATH, DEMAND_PATH, ENCODER_PATH)
+                    else:
+                        _models = model_registry.load_version(version)
+                except (OSError, ValueError) as e:
+                    # Missing or unreadable artifacts; xgboost reports those as XGBoostError, a ValueError.
+                    raise ModelsUnavailable(f"cannot load {'version ' + version if version else 'the model files'}: {e}") from e
+                _loaded_version = version
+    return _models
+
+
+def loaded_version():
+    return _loaded_version
+
+
+def _warm():
+    try:
+        get_models()
+    except Exception:
+        # A failed warm-up is retried, and reported, by the page that needs the models.
+        pass
+
+
+def warm_models_async():
+    global _warm_thread
+    if _models is None and _warm_thread is None:
+        _warm_thread = threading.Thread(target=_warm, name='model-warmup', daemon=True)
+        _warm_thread.start()
+    return _warm_thread
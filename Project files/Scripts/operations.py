@@ -0,0 +1,141 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from db import DATABASE, get_db_connection
+from features import customer_features, demand_frame, encode_demand_features, parse_order_dates
+from metrics import DB_WRITE, INFERENCE, timed
+from recommender import CUSTOMER_FEATURES, recommend_top_k
+
+PRODUCT_COLUMNS = ['ProductName', 'Quantity', 'Price', 'DiscountPrice', 'Category', 'SubCategory', 'Image_Url', 'Absolute_Url']
+PRODUCT_TEXT_COLUMNS = ['ProductName', 'Quantity', 'Category', 'SubCategory', 'Image_Url', 'Absolute_Url']
+EDITABLE_PRODUCT_COLUMNS = ['ProductName', 'Price', 'DiscountPrice', 'Image_Url']
+
+
+def filter_products(products_df, category=None, query=None):
+    filtered = products_df if not category or category == "All Products" else products_df[products_df['Category'] == category]
+    if query:
+        filtered = filtered[filtered['ProductName'].str.contains(query, case=False, regex=False)]
+    return filtered
+
+
+def cart_product_names(cart):
+    return [item['ProductName'] if isinstance(item, dict) and 'ProductName' in item else item for item in cart]
+
+
+def price_cart(cart, products_df):
+    # Returns [product, quantity, unit price, line total] rows and the order total.
+    processed_cart = cart_product_names(cart)
+    quantities = pd.Series(processed_cart, dtype=object).value_counts(sort=False)
+    prices = products_df.drop_duplicates('ProductName').set_index('ProductName')['Price'].reindex(quantities.index)
+    if prices.isna().any():
+        raise KeyError(f"Unknown products in cart: {', '.join(prices.index[prices.isna()])}")
+    cart_items_data = [[name, int(quantity), price, quantity * price]
+                       for name, quantity, price in zip(quantities.index, quantities.to_numpy(), prices.to_numpy())]
+    total_cost = sum(item[3] for item in cart_items_data)
+    return cart_items_data, total_cost
+
+
+def product_errors(product, existing_names, current_name=None):
+    # The checks the manager forms apply, for a full product or just the editable columns; returns error messages.
+    errors = []
+    if not all(product.get(column) for column in PRODUCT_TEXT_COLUMNS if column in product):
+        errors.append("All fields must be filled.")
+    if 'Quantity' in product and not (str(product['Quantity']).isdigit() and int(product['Quantity']) > 0):
+        errors.append("Quantity must be a positive integer.")
+    for column in ('Price', 'DiscountPrice'):
+        value = product.get(column)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not value >= 0:
+            errors.append(f"{column} must be a number of at least 0.")
+    if not all(str(product.get(column, '')).startswith(("http://", "https://")) for column in ('Image_Url', 'Absolute_Url') if column in product):
+        errors.append("Please enter valid URLs starting with http:// or https://")
+    if product.get('ProductName') != current_name and product.get('ProductName') in existing_names:
+        errors.append("Product name already exists. Please use a different name.")
+    return errors
+
+
+def add_product(product, database=DATABASE):
+    with timed(DB_WRITE, operation='add_product'), get_db_connection(database) as conn:
+        conn.execute(f"INSERT INTO ProductsOnWebsite ({', '.join(PRODUCT_COLUMNS)}) VALUES ({', '.join('?' * len(PRODUCT_COLUMNS))})",
+                     [product[column] for column in PRODUCT_COLUMNS])
+        conn.commit()
+
+
+def update_product(old_name, old_quantity, new_name, new_price, new_discount_price, new_image_url, database=DATABASE):
+    # Returns the number of rows changed, 0 if the product no longer exists.
+    with timed(DB_WRITE, operation='update_product'), get_db_connection(database) as conn:
+        cursor = conn.execute("""
+            UPDATE ProductsOnWebsite
+            SET ProductName = ?, Price = ?, DiscountPrice = ?, Image_Url = ?
+            WHERE ProductName = ? AND Quantity = ?""", (new_name, new_price, new_discount_price, new_image_url, old_name, old_quantity))
+        conn.commit()
+    return cursor.rowcount
+
+
+def delete_product(product_name, quantity, database=DATABASE):
+    with timed(DB_WRITE, operation='delete_product'), get_db_connection(database) as conn:
+        cursor = conn.execute("DELETE FROM ProductsOnWebsite WHERE ProductName = ? AND Quantity = ?", (product_name, quantity))
+        conn.commit()
+    return cursor.rowcount
+
+
+def place_order(username, cart_items_data, database=DATABASE):
+    # The order id carries the rowid the order's first line gets. BEGIN IMMEDIATE takes the write
+    # lock before that rowid is read, so concurrent checkouts, in any process, get distinct ids.
+    today_date = datetime.datetime.now().strftime('%d/%m/%Y')
+    with timed(DB_WRITE, operation='place_order'), get_db_connection(database) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        next_rowid = conn.execute("SELECT COALESCE(MAX(rowid), 0) + 1 FROM Orders").fetchone()[0]
+        order_id = f"{username}-{next_rowid}"
+        conn.executemany(
+            "INSERT INTO Orders (CustomerID, OrderID, ProductName, Quantity, OrderDate, Price) VALUES (?, ?, ?, ?, ?, ?)",
+            [(username, order_id, item[0], item[1], today_date, item[2]) for item in cart_items_data]
+        )
+        conn.commit()
+    return order_id
+
+
+def order_history(orders_df, username):
+    # The customer's orders, newest first, as (order_id, order date, lines) tuples.
+    user_orders = orders_df[orders_df['CustomerID'] == username].copy()
+    user_orders['OrderDate'] = parse_order_dates(user_orders['OrderDate']).dt.date
+    user_orders.sort_values(by='OrderDate', ascending=False, inplace=True)
+    return [(order_id, order_details['OrderDate'].iloc[0], order_details)
+            for order_id, order_details in user_orders.groupby('OrderID', sort=False)]
+
+
+def recommend_products(orders_df, products_df, customer_id, model, le_product, k=10):
+    # Top-k products for the customer, or None if they have no orders yet.
+    # Products added since the encoder was fitted are left out until the models are refreshed.
+    # Positions in classes_ are what le_product.transform returns; get_indexer finds them with one
+    # hash lookup and marks unknown names with -1, where np.isin would sort both string arrays.
+    classes = pd.Index(le_product.classes_)
+    customer_orders = orders_df[orders_df['CustomerID'] == customer_id]
+    customer_product_ids = classes.get_indexer(customer_orders['ProductName'])
+    known = customer_product_ids >= 0
+    if not known.any():
+        return None
+    customer_row = customer_features(customer_orders[known], customer_product_ids[known])[CUSTOMER_FEATURES].to_numpy()
+    product_names = products_df['ProductName'].unique()
+    product_ids = classes.get_indexer(product_names)
+    product_names, product_ids = product_names[product_ids >= 0], product_ids[product_ids >= 0]
+    product_ids, unique_indices = np.unique(product_ids, return_index=True)
+    today = pd.Timestamp('today')
+    top_indices, top_scores = recommend_top_k(model, product_ids, customer_row, today.month, today.dayofweek, k=k)
+    return pd.DataFrame({
+        'ProductName': product_names[unique_indices][top_indices[0]],
+        'PredictedQuantity': top_scores[0]
+    })
+
+
+def forecast_demand(orders_df, products_df, demand_model):
+    # Models published without their training-time encoding (imported files) are served with one
+    # fitted on orders_df, as before.
+    merged_df = demand_frame(orders_df, products_df)
+    product_names = merged_df['ProductName']
+    X_scaled, _ = encode_demand_features(merged_df, getattr(demand_model, 'encoding', None))
+    with timed(INFERENCE, model='demand'):
+        merged_df['Predict Demand Score'] = demand_model.predict(X_scaled)
+    merged_df['ProductName'] = product_names
+    return merged_df
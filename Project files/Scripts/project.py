@@ -1,35 +1,62 @@
+import os
 import streamlit as st
 import pandas as pd
 import sqlite3
-from xgboost import XGBRegressor
-import datetime
-import pickle
-import joblib
 import numpy as np
-from contextlib import contextmanager
-from sklearn.preprocessing import LabelEncoder, StandardScaler
-from matplotlib import pyplot as plt
+from contextlib import nullcontext
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from db import catalog_version, ensure_indexes, get_db_connection, max_rowid, read_customer_orders, read_table
+import metrics
+from image_cache import THUMBNAIL_SIZE, ThumbnailCache
+from session_memory import SessionRegistry, SharedTables, capacity
+from metrics import DB_WRITE, timed
+from models import get_models, loaded_version, warm_models_async
+import operations
+from operations import filter_products, forecast_demand, order_history, place_order, price_cart, recommend_products
+
+METRICS_PORT = os.environ.get('FRESH_MARKET_METRICS_PORT')
+METRICS_FILE = os.environ.get('FRESH_MARKET_METRICS_FILE')
+SESSION_BUDGET_MB = os.environ.get('FRESH_MARKET_SESSION_BUDGET_MB')
+# Orders are not shared: pages read the rows they need, so checkouts never reload a whole table.
+SESSION_TABLES = {'managers_df': 'managers', 'customers_df': 'customers', 'products_df': 'ProductsOnWebsite'}
 
-@contextmanager
-def get_db_connection(database='BigBasket.db'):
-    conn = sqlite3.connect(database)
-    try:
-        yield conn
-    finally:
-        conn.close()
+@st.cache_resource
+def get_image_cache():
+    return ThumbnailCache()
 
-def read_table(table_name):
-    with get_db_connection() as conn:
-        return pd.read_sql(f"SELECT * FROM {table_name}", conn)
+@st.cache_resource
+def get_shared_tables():
+    return SharedTables(read_table, {'ProductsOnWebsite': catalog_version})
 
 @st.cache_resource
-def load_model(model_path, demand_path, encoder_path):
-    model = XGBRegressor()
-    model.load_model(model_path)
-    demand_model = joblib.load(open(demand_path, 'rb'))
-    with open(encoder_path, 'rb') as f:
-        le_product = pickle.load(f)
-    return model, demand_model, le_product
+def get_session_registry():
+    return SessionRegistry(is_active=lambda session_id: not Runtime.exists() or Runtime.instance().is_active_session(session_id))
+
+@st.cache_resource
+def prepare_database():
+    ensure_indexes()
+
+@st.cache_resource(max_entries=1)
+def get_demand_forecast(orders_rowid, catalog, model_version):
+    # One forecast per process, recomputed after a new order, a catalogue change or a model
+    # activation. Every session gets the same frame, so it is only read.
+    _, demand_model, _ = get_models()
+    merged_df = forecast_demand(read_table("Orders"), get_shared_tables().get("ProductsOnWebsite"), demand_model)
+    return merged_df[['ProductName', 'OrderDate', 'Predict Demand Score']]
+
+def active_session():
+    run_ctx = get_script_run_ctx()
+    if run_ctx is None:
+        return nullcontext()
+    return get_session_registry().active(run_ctx.session_id, run_ctx.session_state)
+
+def thumbnails(urls, size=THUMBNAIL_SIZE):
+    return get_image_cache().get_many(urls, size)
+
+def prefetch_page_images(products_df, page, products_per_page):
+    start_idx = page * products_per_page
+    get_image_cache().prefetch(products_df['Image_Url'].iloc[start_idx:start_idx + products_per_page].tolist())
 
 def load_initial_data():
     managers_df = read_table("managers")
@@ -113,10 +140,7 @@ def render_customer_header():
     with menu_col1:
         categories = ["All Products"] + sorted(st.session_state['products_df']['Category'].unique().tolist())
         selected_category = st.selectbox("Category", categories, key="category_select_customer")
-        st.session_state['filtered_products_df'] = st.session_state['products_df'] if selected_category == "All Products" else st.session_state['products_df'][st.session_state['products_df']['Category'] == selected_category]
-
-    if 'search_query_customer' in st.session_state and st.session_state['search_query_customer']:
-        st.session_state['filtered_products_df'] = st.session_state['filtered_products_df'][st.session_state['filtered_products_df']['ProductName'].str.contains(st.session_state['search_query_customer'], case=False)]
+        st.session_state['filtered_products_df'] = filter_products(st.session_state['products_df'], selected_category, st.session_state.get('search_query_customer'))
     with menu_col2:
         st.write("")
         st.write("")
@@ -183,12 +207,12 @@ def registration_page(customers_df):
                 if new_username in customers_df['name'].values:
                     st.error("Username already exists")
                 else:
-                    with get_db_connection() as conn:
+                    with timed(DB_WRITE, operation='register_customer'), get_db_connection() as conn:
                         cursor = conn.cursor()
                         cursor.execute("INSERT INTO customers (name, password) VALUES (?, ?)", (new_username, new_password))
                         conn.commit()
                     st.cache_data.clear()
-                    st.session_state['customers_df'] = read_table("customers")
+                    st.session_state['customers_df'] = get_shared_tables().refresh("customers")
                     st.success("Registration successful!")
                     st.session_state['logged_in'] = False
                     st.session_state['user_type'] = "Customer"
@@ -223,13 +247,14 @@ def view_cart():
         for product_name in st.session_state['cart']:
             product_name = product_name.get('ProductName', '') if isinstance(product_name, dict) else product_name
             cart_dict[product_name] = cart_dict.get(product_name, 0) + 1
-        for product_name, quantity in cart_dict.items():
-            product_details = st.session_state['products_df'][st.session_state['products_df']['ProductName'] == product_name].iloc[0]
+        cart_products = [st.session_state['products_df'][st.session_state['products_df']['ProductName'] == product_name].iloc[0] for product_name in cart_dict]
+        cart_images = thumbnails([product_details.get('Image_Url') for product_details in cart_products], 150)
+        for (product_name, quantity), product_details, image in zip(cart_dict.items(), cart_products, cart_images):
             cols = st.columns([3, 1, 1, 1, 2])
             with cols[0]:
                 st.write(product_name)
                 if 'Image_Url' in product_details:
-                    st.image(product_details['Image_Url'], width=150)
+                    st.image(image, width=150)
             with cols[1]:
                 if st.button("\-", key=f'decrease_{product_name}'):
                     if quantity > 1:
@@ -263,35 +288,15 @@ def checkout():
             st.rerun()
         return
     checkout_columns = ["Product", "Quantity", "Price per Unit", "Product Total"]
-    cart_items_data = []
-    total_cost = 0
-    processed_cart = [item['ProductName'] if isinstance(item, dict) and 'ProductName' in item else item for item in st.session_state['cart']]
-    for product_name in set(processed_cart):
-        product_details = st.session_state['products_df'][st.session_state['products_df']['ProductName'] == product_name].iloc[0]
-        quantity = processed_cart.count(product_name)
-        price_per_unit = product_details['Price']
-        product_total = quantity * price_per_unit
-        total_cost += product_total
-        cart_items_data.append([product_name, quantity, price_per_unit, product_total])
+    cart_items_data, total_cost = price_cart(st.session_state['cart'], st.session_state['products_df'])
     cart_items_df = pd.DataFrame(cart_items_data, columns=checkout_columns)
     st.table(cart_items_df)
     st.markdown(f"**Total Cost: ₹{total_cost:.2f}**")
     col1, col2 = st.columns(2)
     with col1:
         if st.button("Confirm Order"):
-            today_date = datetime.datetime.now().strftime('%d/%m/%Y')
-            order_id = generate_order_id(st.session_state['username'])
-            customer_id = st.session_state['username']
-            with get_db_connection() as conn:
-                cursor = conn.cursor()
-                for item in cart_items_data:
-                    cursor.execute(
-                        "INSERT INTO Orders (CustomerID, OrderID, ProductName, Quantity, OrderDate, Price) VALUES (?, ?, ?, ?, ?, ?)",
-                        (customer_id, order_id, item[0], item[1], today_date, item[2])
-                    )
-                conn.commit()
+            place_order(st.session_state['username'], cart_items_data)
             st.cache_data.clear()
-            st.session_state['orders_df'] = read_table("Orders")
             st.success("Thank you for your order! Your purchase has been added to your shopping history.")
             st.session_state['cart'] = []
             st.session_state['view_mode'] = 'products'
@@ -301,13 +306,6 @@ def checkout():
             st.session_state['view_mode'] = 'cart'
             st.rerun()
 
-def generate_order_id(username):
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM Orders WHERE CustomerID=?", (username,))
-        order_count = cursor.fetchone()[0]
-    return f"{username}-{order_count + 1}"
-
 def display_products(products_df):
     products_per_page = 42
     total_products = len(products_df)
@@ -317,6 +315,7 @@ def display_products(products_df):
     start_idx = (st.session_state['current_page'] - 1) * products_per_page
     end_idx = start_idx + products_per_page
     products_to_display = products_df.iloc[start_idx:end_idx]
+    page_images = thumbnails(products_to_display['Image_Url'].tolist())
     num_columns = 6
     for i in range(0, len(products_to_display), num_columns):
         cols = st.columns(num_columns)
@@ -328,7 +327,7 @@ def display_products(products_df):
                     truncated_product_name = truncate_text(product['ProductName'], 25)
                     with st.expander(truncated_product_name):
                         st.write(product['ProductName'])
-                    st.image(product['Image_Url'], use_column_width=True)
+                    st.image(page_images[product_idx], use_column_width=True)
                     st.write(f"Price: ₹{product['Price']}")
                     st.write(f"After Discount: ₹{product['DiscountPrice']}")
                     if st.button("Add to Cart", key=f'Add_to_Cart_{product_idx}'):
@@ -336,6 +335,8 @@ def display_products(products_df):
                             st.session_state['cart'] = []
                         st.session_state['cart'].append(product['ProductName'])
                         st.success(f"Added {truncate_text(product['ProductName'], 13)} to cart")
+    if st.session_state['current_page'] < total_pages:
+        prefetch_page_images(products_df, st.session_state['current_page'], products_per_page)
     col1, col2, col3 = st.columns(3)
     with col1:
         if st.button("Previous") and st.session_state['current_page'] > 1:
@@ -357,6 +358,7 @@ def display_manager_products(filtered_products_df):
     start_idx = (st.session_state['manager_current_page'] - 1) * products_per_page
     end_idx = start_idx + products_per_page
     products_to_display = filtered_products_df.iloc[start_idx:end_idx]
+    page_images = thumbnails(products_to_display['Image_Url'].tolist())
     num_columns = 6
     for i in range(0, len(products_to_display), num_columns):
         cols = st.columns(num_columns)
@@ -369,7 +371,7 @@ def display_manager_products(filtered_products_df):
                     with st.expander(truncated_product_name):
                         st.write(f"Name: {product['ProductName']}")
                         st.write(f"Quantity: {product['Quantity']}")
-                    st.image(product['Image_Url'], use_column_width=True)
+                    st.image(page_images[product_idx], use_column_width=True)
                     st.write(f"Price: ₹{product['Price']}")
                     st.write(f"After Discount: ₹{product['DiscountPrice']}")
 
@@ -384,6 +386,8 @@ def display_manager_products(filtered_products_df):
                         unique_delete_key = f'delete_{product["ProductName"]}_{product["Quantity"]}'
                         if st.button("Delete", key=unique_delete_key):
                             delete_product(product["ProductName"], product["Quantity"])
+    if st.session_state['manager_current_page'] < total_pages:
+        prefetch_page_images(filtered_products_df, st.session_state['manager_current_page'], products_per_page)
     col1, col2, col3 = st.columns([1, 2, 1])
     with col1:
         if st.button("Previous") and st.session_state['manager_current_page'] > 1:
@@ -397,14 +401,11 @@ def display_manager_products(filtered_products_df):
             st.rerun()
 
 def delete_product(product_name, quantity):
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM ProductsOnWebsite WHERE ProductName = ? AND Quantity = ?", (product_name, quantity))
-        conn.commit()
-        st.sidebar.success("Product deleted successfully!")
-        st.cache_data.clear()
-        st.session_state['products_df'] = read_table("ProductsOnWebsite")
-        st.rerun()
+    operations.delete_product(product_name, quantity)
+    st.sidebar.success("Product deleted successfully!")
+    st.cache_data.clear()
+    st.session_state['products_df'] = get_shared_tables().refresh("ProductsOnWebsite")
+    st.rerun()
 
 def manager_welcome_page(products_df):
     if st.session_state.get('view_mode', '') in ['products', 'manager_products']:
@@ -435,6 +436,10 @@ def manager_welcome_page(products_df):
         if st.button('Demand Forecasting Panel'):
             st.session_state['view_mode'] = 'demand_forecasting'
             st.rerun()
+        if st.checkbox("Show performance metrics", key='show_metrics_panel'):
+            render_metrics_panel()
+        if st.checkbox("Show session memory", key='show_session_memory_panel'):
+            render_session_memory_panel()
 
     if st.session_state.get('view_mode', '') == 'manager_products':
         display_manager_products(st.session_state['filtered_products_df'])
@@ -449,6 +454,42 @@ def manager_welcome_page(products_df):
     if st.session_state['show_edit_form']:
         edit_product()
 
+def render_metrics_panel():
+    previous_rerun = st.session_state.get('previous_rerun_stats')
+    if previous_rerun and 'seconds' in previous_rerun:
+        st.caption(f"Last rerun: {previous_rerun['page']} in {previous_rerun['seconds'] * 1000:.0f} ms, {previous_rerun['queries']} queries")
+    rows = metrics.summary_rows()
+    if rows:
+        # Values are in each metric's own unit: seconds for the *_seconds metrics, statements for queries_per_rerun.
+        st.dataframe(pd.DataFrame(rows).round({'mean': 4, 'p50': 4, 'p95': 4}), hide_index=True)
+    else:
+        st.caption("No metrics recorded yet.")
+
+def render_session_memory_panel():
+    registry = get_session_registry()
+    shared_frames = get_shared_tables().frames()
+    shared_bytes = get_shared_tables().nbytes()
+    usage_rows = registry.usage(shared_frames.values())
+    private_bytes = sum(row['bytes'] for row in usage_rows)
+    st.caption(f"{len(usage_rows)} live sessions: {private_bytes / 2**20:.1f} MB private, "
+               f"{shared_bytes / 2**20:.1f} MB in {len(shared_frames)} shared tables. "
+               f"{registry.expired} sessions expired, {registry.evicted} idle keys evicted.")
+    if SESSION_BUDGET_MB:
+        fits = capacity(usage_rows, shared_bytes, float(SESSION_BUDGET_MB) * 2**20)
+        if fits is not None:
+            st.caption(f"About {fits:,} sessions like these fit in {float(SESSION_BUDGET_MB):,.0f} MB.")
+    if usage_rows:
+        usage_df = pd.DataFrame(usage_rows[:10])
+        usage_df['MB'] = (usage_df['bytes'] / 2**20).round(2)
+        usage_df['largest key MB'] = (usage_df['largest_key_bytes'] / 2**20).round(2)
+        usage_df['idle (s)'] = usage_df['idle_seconds'].round()
+        st.dataframe(usage_df[['session', 'user', 'MB', 'largest_key', 'largest key MB', 'idle (s)']], hide_index=True)
+
+def current_page_name():
+    if not st.session_state['logged_in']:
+        return st.session_state['page'] or "Login"
+    return f"{st.session_state['user_type']}:{st.session_state['view_mode']}"
+
 def edit_product():
     if 'selected_product_edit_key' in st.session_state:
         selected_product_key = st.session_state['selected_product_edit_key']
@@ -461,11 +502,10 @@ def edit_product():
                 new_price = st.number_input("Price", value=float(product_details['Price']), min_value=0.0, key=f"edit_new_price_{selected_product_key}")
                 new_discount_price = st.number_input("Discount Price", value=float(product_details['DiscountPrice']), min_value=0.0, key=f"edit_new_discount_price_{selected_product_key}")
                 new_image_url = st.text_input("Image URL", value=product_details['Image_Url'], key=f"edit_new_image_url_{selected_product_key}")
-                all_fields_filled = new_product_name and new_image_url
-                not_duplicate = not (new_product_name != product_details['ProductName'] and new_product_name in st.session_state['products_df']['ProductName'].values)
-                valid_url = new_image_url.startswith("http://") or new_image_url.startswith("https://")
                 submit_button = st.form_submit_button("Save Changes")
-            if submit_button and all_fields_filled and not_duplicate and valid_url:
+            changes = {'ProductName': new_product_name, 'Price': new_price, 'DiscountPrice': new_discount_price, 'Image_Url': new_image_url}
+            errors = operations.product_errors(changes, st.session_state['products_df']['ProductName'].values, product_details['ProductName'])
+            if submit_button and not errors:
                 if st.sidebar.button("Confirm Update"):
                     update_product(product_name, quantity, new_product_name, new_price, new_discount_price, new_image_url)
                     st.sidebar.success("Product updated successfully!")
@@ -475,12 +515,8 @@ def edit_product():
                 else:
                     st.sidebar.error("Please confirm the changes.")
             else:
-                if not all_fields_filled:
-                    st.sidebar.error("All fields must be filled.")
-                if not not_duplicate:
-                    st.sidebar.error("Product name already exists. Please use a different name.")
-                if not valid_url:
-                    st.sidebar.error("Please enter a valid URL.")
+                for error in errors:
+                    st.sidebar.error(error)
             if st.sidebar.button("Cancel Edit"):
                 st.session_state['show_edit_form'] = False
                 del st.session_state['selected_product_edit_key']
@@ -491,15 +527,9 @@ def edit_product():
             st.rerun()
 
 def update_product(old_name, old_quantity, new_name, new_price, new_discount_price, new_image_url):
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE ProductsOnWebsite
-            SET ProductName = ?, Price = ?, DiscountPrice = ?, Image_Url = ?
-            WHERE ProductName = ? AND Quantity = ?""", (new_name, new_price, new_discount_price, new_image_url, old_name, old_quantity))
-        conn.commit()
+    operations.update_product(old_name, old_quantity, new_name, new_price, new_discount_price, new_image_url)
     st.cache_data.clear()
-    st.session_state['products_df'] = read_table("ProductsOnWebsite")
+    st.session_state['products_df'] = get_shared_tables().refresh("ProductsOnWebsite")
     del st.session_state['selected_product_edit_key']
     st.rerun()
 
@@ -532,32 +562,19 @@ def add_new_product():
             new_absolute_url = st.text_input("Absolute URL", key="new_absolute_url")
             submit_button = st.form_submit_button("Add Product")
         if submit_button:
-            all_fields_filled = all([new_product_name, new_quantity, new_category, new_sub_category, new_image_url, new_absolute_url])
-            is_quantity_valid = new_quantity.isdigit() and int(new_quantity) > 0
-            is_urls_valid = all([url.startswith("http://") or url.startswith("https://") for url in [new_image_url, new_absolute_url]])
-            not_duplicate_name = new_product_name not in st.session_state['products_df']['ProductName'].values
-            if all_fields_filled and is_quantity_valid and is_urls_valid and not_duplicate_name:
-                with get_db_connection() as conn:
-                    cursor = conn.cursor()
-                    cursor.execute("""
-                        INSERT INTO ProductsOnWebsite (ProductName, Quantity, Price, DiscountPrice, Category, SubCategory, Image_Url, Absolute_Url)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)""", 
-                        (new_product_name, new_quantity, new_price, new_discount_price, new_category, new_sub_category, new_image_url, new_absolute_url))
-                    conn.commit()
-                    st.sidebar.success("Product added successfully!")
-                    st.cache_data.clear()
-                    st.session_state['products_df'] = read_table("ProductsOnWebsite")
-                    del st.session_state['show_add_product_form']
-                    st.rerun()
+            new_product = {'ProductName': new_product_name, 'Quantity': new_quantity, 'Price': new_price, 'DiscountPrice': new_discount_price,
+                           'Category': new_category, 'SubCategory': new_sub_category, 'Image_Url': new_image_url, 'Absolute_Url': new_absolute_url}
+            errors = operations.product_errors(new_product, st.session_state['products_df']['ProductName'].values)
+            if not errors:
+                operations.add_product(new_product)
+                st.sidebar.success("Product added successfully!")
+                st.cache_data.clear()
+                st.session_state['products_df'] = get_shared_tables().refresh("ProductsOnWebsite")
+                del st.session_state['show_add_product_form']
+                st.rerun()
             else:
-                if not all_fields_filled:
-                    st.sidebar.error("All fields must be filled.")
-                if not is_quantity_valid:
-                    st.sidebar.error("Quantity must be a positive integer.")
-                if not is_urls_valid:
-                    st.sidebar.error("Please enter valid URLs starting with http:// or https://")
-                if not not_duplicate_name:
-                    st.sidebar.error("Product name already exists. Please use a different name.")
+                for error in errors:
+                    st.sidebar.error(error)
         if st.sidebar.button("Cancel Add"):
             del st.session_state['show_add_product_form']
             st.rerun()
@@ -576,18 +593,15 @@ def view_shopping_history(username):
             st.session_state['view_mode'] = 'products'
             st.rerun()
     try:
-        st.session_state['orders_df']['OrderDate'] = pd.to_datetime(st.session_state['orders_df']['OrderDate'], format='%d/%m/%Y').dt.date
+        user_orders = order_history(read_customer_orders(username), username)
     except ValueError as e:
         st.error(f"Date format error: {str(e)}")
         return
-    user_orders = st.session_state['orders_df'][st.session_state['orders_df']['CustomerID'] == username].copy()
-    user_orders.sort_values(by='OrderDate', ascending=False, inplace=True)
-    if user_orders.empty:
+    if not user_orders:
         st.warning("You have no shopping history.")
     else:
-        grouped_orders = user_orders.groupby('OrderID', sort=False)
-        for order_id, order_details in grouped_orders:
-            order_date = order_details['OrderDate'].iloc[0].strftime('%d/%m/%Y')
+        for order_id, order_date, order_details in user_orders:
+            order_date = order_date.strftime('%d/%m/%Y')
             st.markdown(f"### Order ID: {order_id} - Date: {order_date}")
             order_details['Price'] = order_details['Price'].apply(lambda x: f"₹{x:.2f}")
             display_cols = ['ProductName', 'Quantity', 'Price']
@@ -613,33 +627,11 @@ def view_recommended_cart():
     if st.session_state['recommended_cart'] is None:
         st.session_state['recommended_cart'] = []
 
-    st.session_state['orders_df']['ProductID'] = le_product.transform(st.session_state['orders_df']['ProductName'])
-
-    customer_features = st.session_state['orders_df'].groupby('CustomerID').agg(
-        TotalOrders=pd.NamedAgg(column='OrderID', aggfunc='nunique'),
-        AvgQuantity=pd.NamedAgg(column='Quantity', aggfunc='mean'),
-        MostBoughtProduct=pd.NamedAgg(column='ProductID', aggfunc=lambda x: x.mode()[0])
-    ).reset_index()
-
-    if customer_id in customer_features['CustomerID'].values:
-        customer_data = customer_features[customer_features['CustomerID'] == customer_id].iloc[0]
-        product_names = st.session_state['products_df']['ProductName'].unique()
-        product_ids, unique_indices = np.unique(le_product.transform(product_names), return_index=True)
-        product_images = st.session_state['products_df']['Image_Url'].values[unique_indices]
-        sample_customer_data = pd.DataFrame({
-            'ProductID': product_ids,
-            'Month': [pd.Timestamp('today').month] * len(product_ids),
-            'DayOfWeek': [pd.Timestamp('today').dayofweek] * len(product_ids),
-            'TotalOrders': [customer_data['TotalOrders']] * len(product_ids),
-            'AvgQuantity': [customer_data['AvgQuantity']] * len(product_ids),
-            'MostBoughtProduct': [customer_data['MostBoughtProduct']] * len(product_ids)
-        })
-        predicted_quantities = model.predict(sample_customer_data)
-        sample_customer_data['ProductName'] = product_names
-        sample_customer_data['ProductImage'] = product_images
-        sample_customer_data['PredictedQuantity'] = predicted_quantities
-        top_recommendations = sample_customer_data.sort_values(by='PredictedQuantity', ascending=False).head(10)
-        
+    with st.spinner("Loading recommendation model..."):
+        model, _, le_product = get_models()
+    top_recommendations = recommend_products(read_customer_orders(customer_id), st.session_state['products_df'], customer_id, model, le_product)
+
+    if top_recommendations is not None:
         if top_recommendations.empty:
             st.warning("You need to make orders first to get a recommended cart! 😊")
         else:
@@ -648,12 +640,13 @@ def view_recommended_cart():
                     st.session_state['recommended_cart'].append(product)
                     
             updated_recommended_cart = list(st.session_state['recommended_cart'])
-            for _, row in top_recommendations.iterrows():
+            recommended_product_indices = [np.where(st.session_state['products_df']['ProductName'] == product)[0][0] for product in top_recommendations['ProductName']]
+            recommended_images = thumbnails(st.session_state['products_df']['Image_Url'].iloc[recommended_product_indices].tolist(), 150)
+            for (_, row), image in zip(top_recommendations.iterrows(), recommended_images):
                 cols = st.columns([3, 1, 1, 1, 1, 2])
                 with cols[0]:
                     st.write(row['ProductName'])
-                    recommended_product_index = np.where(st.session_state['products_df']['ProductName'] == row['ProductName'])[0][0]
-                    st.image(st.session_state['products_df']['Image_Url'].iloc[recommended_product_index], width=150)
+                    st.image(image, width=150)
                 with cols[1]:
                     if st.button("\-", key=f'decrease_{row["ProductName"]}'):
                         if updated_recommended_cart.count(row['ProductName']) > 1:
@@ -715,7 +708,7 @@ def render_manager_header():
             st.rerun()
 
     if 'search_query_manager' in st.session_state and st.session_state['search_query_manager']:
-        st.session_state['filtered_products_df'] = st.session_state['products_df'][st.session_state['products_df']['ProductName'].str.contains(st.session_state['search_query_manager'], case=False)]
+        st.session_state['filtered_products_df'] = filter_products(st.session_state['products_df'], query=st.session_state['search_query_manager'])
     else:
         st.session_state['filtered_products_df'] = st.session_state['products_df']
 
@@ -748,7 +741,7 @@ def update_profile():
             elif new_password != confirm_password:
                 st.error("Passwords do not match.")
             else:
-                with get_db_connection() as conn:
+                with timed(DB_WRITE, operation='update_profile'), get_db_connection() as conn:
                     cursor = conn.cursor()
                     cursor.execute("SELECT name FROM customers WHERE name = ?", (new_username,))
                     if cursor.fetchone() and new_username != current_user[0]:
@@ -760,7 +753,7 @@ def update_profile():
                             st.cache_data.clear()
                             st.success("Profile updated successfully!")
                             st.session_state['username'] = new_username
-                            st.session_state['customers_df'] = read_table("customers")
+                            st.session_state['customers_df'] = get_shared_tables().refresh("customers")
                         except sqlite3.Error as e:
                             st.error(f"An error occurred: {e}")
 
@@ -778,7 +771,7 @@ def admin_registration():
                 if new_username in st.session_state['managers_df']['name'].values:
                     st.error("Manager username already exists")
                 else:
-                    with get_db_connection() as conn:
+                    with timed(DB_WRITE, operation='register_manager'), get_db_connection() as conn:
                         cursor = conn.cursor()
                         cursor.execute("INSERT INTO managers (name, password) VALUES (?, ?)", (new_username, new_password))
                         conn.commit()
@@ -787,7 +780,7 @@ def admin_registration():
                         st.session_state['logged_in'] = True
                         st.session_state['user_type'] = "Manager"
                         st.session_state['username'] = new_username
-                        st.session_state['managers_df'] = read_table("managers")
+                        st.session_state['managers_df'] = get_shared_tables().refresh("managers")
                         st.session_state['view_mode'] = 'manager_products'
                         st.rerun()
             else:
@@ -808,24 +801,24 @@ def manage_customer():
     new_password = st.text_input("New Password", type="password")
     if st.button("Update"):
         if new_name and new_password:
-            with get_db_connection() as conn:
+            with timed(DB_WRITE, operation='update_customer'), get_db_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute("UPDATE customers SET name = ?, password = ? WHERE name = ?", (new_name, new_password, selected_customer))
                 conn.commit()
                 st.cache_data.clear()
                 st.success("Customer details updated successfully!")
-                st.session_state['customers_df'] = read_table("customers")
+                st.session_state['customers_df'] = get_shared_tables().refresh("customers")
                 st.rerun()
         else:
             st.error("Please fill in all fields.")
     if st.button("Delete"):
-        with get_db_connection() as conn:
+        with timed(DB_WRITE, operation='delete_customer'), get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM customers WHERE name = ?", (selected_customer,))
             conn.commit()
             st.cache_data.clear()
             st.success("Customer deleted successfully!")
-            st.session_state['customers_df'] = read_table("customers")
+            st.session_state['customers_df'] = get_shared_tables().refresh("customers")
             st.rerun()
 
 def demand_forecasting():
@@ -840,38 +833,8 @@ def demand_forecasting():
     """)
 
     with st.spinner("Loading data and calculating demand forecasts..."):
-        st.session_state['orders_df']['OrderDate'] = pd.to_datetime(st.session_state['orders_df']['OrderDate'], format='%d/%m/%Y')
-        daily_demand_df = st.session_state['orders_df'].groupby(['ProductName', 'OrderDate']).agg({
-            'Quantity': 'sum',
-            'Price': 'mean'
-        }).reset_index()
-        merged_df = pd.merge(daily_demand_df, st.session_state['products_df'], on='ProductName', how='left', suffixes=('_order', '_product'))
-        merged_df['DiscountPrice'] = merged_df['DiscountPrice'].fillna(0)
-        merged_df['Price_order'] = merged_df['Price_order'].fillna(0)
-        merged_df['Price_product'] = merged_df['Price_product'].fillna(0)
-        merged_df['PriceDiff'] = merged_df['Price_order'] - merged_df['DiscountPrice']
-        if 'Quantity' not in merged_df.columns:
-            merged_df['Quantity'] = merged_df['Quantity_order'].fillna(0)
-        merged_df['OrderDay'] = merged_df['OrderDate'].dt.day
-        merged_df['OrderMonth'] = merged_df['OrderDate'].dt.month
-        merged_df['Price_Discount_Interaction'] = merged_df['Price_order'] * merged_df['DiscountPrice']
-        merged_df['Lag_Quantity_1'] = merged_df.groupby('ProductName')['Quantity'].shift(1).fillna(0)
-        merged_df['Lag_Quantity_2'] = merged_df.groupby('ProductName')['Quantity'].shift(2).fillna(0)
-        merged_df['Lag_Quantity_3'] = merged_df.groupby('ProductName')['Quantity'].shift(3).fillna(0)
-        merged_df['Rolling_Mean_3'] = merged_df.groupby('ProductName')['Quantity'].transform(lambda x: x.shift(1).rolling(window=3).mean()).fillna(0)
-        label_encoders = {}
-        for column in ['ProductName', 'Brand', 'Category', 'SubCategory']:
-            le = LabelEncoder()
-            merged_df[column] = le.fit_transform(merged_df[column])
-            label_encoders[column] = le
-        X = merged_df[['ProductName', 'Brand', 'Price_order', 'DiscountPrice', 'Category', 'SubCategory', 
-                    'OrderDay', 'OrderMonth', 'PriceDiff', 'Price_Discount_Interaction', 
-                    'Lag_Quantity_1', 'Lag_Quantity_2', 'Lag_Quantity_3', 'Rolling_Mean_3']]
-        scaler = StandardScaler()
-        X_scaled = scaler.fit_transform(X)
-        predictions = demand_model.predict(X_scaled)
-        merged_df['Predict Demand Score'] = predictions
-        merged_df['ProductName'] = label_encoders['ProductName'].inverse_transform(merged_df['ProductName'])
+        get_models()
+        merged_df = get_demand_forecast(max_rowid("Orders"), catalog_version(), loaded_version())
 
     st.write("### Predicted Demand Overview")
     summary_df = merged_df.groupby('ProductName').agg({
@@ -885,6 +848,7 @@ def demand_forecasting():
     if product_selection:
         product_data = merged_df[(merged_df['ProductName'] == product_selection) & (merged_df['OrderDate'] >= pd.Timestamp('2024-01-01'))]
         st.write(f"#### Demand Prediction for {product_selection}")
+        from matplotlib import pyplot as plt
         fig, ax = plt.subplots(figsize=(10, 6))
         ax.plot(product_data['OrderDate'], product_data['Predict Demand Score'], label='Predict Demand Score', color='blue')
         ax.set_xlabel('Date')
@@ -898,31 +862,40 @@ def demand_forecasting():
 
 if __name__ == "__main__":
     st.set_page_config(page_title="Fresh Market", layout="wide", page_icon="bb.jpeg")
-    if 'logged_in' not in st.session_state:
-        st.session_state['logged_in'] = False
-        st.session_state['user_type'] = None
-    if 'page' not in st.session_state:
-        st.session_state['page'] = "Login"
-    inject_custom_css()
-    if 'managers_df' not in st.session_state:
-        st.session_state['managers_df'] = read_table("managers")
-    if 'customers_df' not in st.session_state:
-        st.session_state['customers_df'] = read_table("customers")
-    if 'products_df' not in st.session_state:
-        st.session_state['products_df'] = read_table("ProductsOnWebsite")
-    if 'orders_df' not in st.session_state:
-        st.session_state['orders_df'] = read_table("Orders")
-    model, demand_model, le_product = load_model("xgb_model.json", "best_random_forest_model_with_lags.pkl", "label_encoder.pkl")
-    
-    if st.session_state['logged_in']:
-        if st.session_state['user_type'] == "Manager":
-            manager_welcome_page(st.session_state['products_df'])
-        elif st.session_state['user_type'] == "Customer":
-            if st.session_state['view_mode'] == 'checkout':
-                checkout()
-            else:
-                welcome_page()
-    elif st.session_state['page'] == "Registration":
-        registration_page(st.session_state['customers_df'])
-    else:
-        login_page()
+    prepare_database()
+    # Held for the whole rerun, so idle-session clean-up never runs under this script.
+    with active_session():
+        if 'logged_in' not in st.session_state:
+            st.session_state['logged_in'] = False
+            st.session_state['user_type'] = None
+        if 'page' not in st.session_state:
+            st.session_state['page'] = "Login"
+        inject_custom_css()
+        # Every session points at the same process-wide frames, rebound each rerun so
+        # reloads made by other sessions or by a catalogue ingestion are picked up.
+        shared_tables = get_shared_tables()
+        for key, table_name in SESSION_TABLES.items():
+            st.session_state[key] = shared_tables.get(table_name)
+        if METRICS_PORT:
+            metrics.start_http_server(int(METRICS_PORT))
+        st.session_state['previous_rerun_stats'] = st.session_state.get('rerun_stats')
+        try:
+            with metrics.rerun(current_page_name()) as rerun_stats:
+                st.session_state['rerun_stats'] = rerun_stats
+                if st.session_state['logged_in']:
+                    if st.session_state['user_type'] == "Manager":
+                        manager_welcome_page(st.session_state['products_df'])
+                    elif st.session_state['user_type'] == "Customer":
+                        if st.session_state['view_mode'] == 'checkout':
+                            checkout()
+                        else:
+                            welcome_page()
+                elif st.session_state['page'] == "Registration":
+                    registration_page(st.session_state['customers_df'])
+                else:
+                    login_page()
+        finally:
+            if METRICS_FILE:
+                metrics.write_textfile(METRICS_FILE)
+        if st.session_state['logged_in']:
+            warm_models_async()
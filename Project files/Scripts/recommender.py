@@ -0,0 +1,45 @@
+import numpy as np
+
+from metrics import INFERENCE, timed
+
+FEATURES = ['ProductID', 'Month', 'DayOfWeek', 'TotalOrders', 'AvgQuantity', 'MostBoughtProduct']
+CUSTOMER_FEATURES = ['TotalOrders', 'AvgQuantity', 'MostBoughtProduct']
+
+
+def build_feature_matrix(product_ids, customer_rows, month, day_of_week, out=None):
+    # One block of len(product_ids) rows per customer, columns in FEATURES order.
+    product_ids = np.asarray(product_ids)
+    customer_rows = np.asarray(customer_rows, dtype=np.float32).reshape(-1, len(CUSTOMER_FEATURES))
+    n_products, n_customers = len(product_ids), len(customer_rows)
+    if out is None:
+        out = np.empty((n_customers * n_products, len(FEATURES)), dtype=np.float32)
+    blocks = out.reshape(n_customers, n_products, len(FEATURES))
+    blocks[:, :, 0] = product_ids
+    blocks[:, :, 1] = month
+    blocks[:, :, 2] = day_of_week
+    blocks[:, :, 3:] = customer_rows[:, None, :]
+    return out
+
+
+def top_k(scores, k):
+    # argpartition picks the k best per row in linear time; only those k are sorted.
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.intp)
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def recommend_top_k(model, product_ids, customer_rows, month, day_of_week, k=10):
+    # Returns (indices into product_ids, predicted quantities), one row per customer.
+    features = build_feature_matrix(product_ids, customer_rows, month, day_of_week)
+    booster = model.get_booster() if hasattr(model, 'get_booster') else model
+    # Honour early stopping the same way XGBRegressor.predict does.
+    best_iteration = booster.attr('best_iteration')
+    iteration_range = (0, int(best_iteration) + 1) if best_iteration is not None else (0, 0)
+    with timed(INFERENCE, model='recommender'):
+        scores = booster.inplace_predict(features, iteration_range=iteration_range, validate_features=False)
+    scores = scores.reshape(-1, len(product_ids))
+    indices = top_k(scores, k)
+    return indices, np.take_along_axis(scores, indices, axis=1)
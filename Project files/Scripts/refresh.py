@@ -0,0 +1,235 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import mean_squared_error
+
+import model_registry
+from db import DATABASE, ensure_indexes, orders_watermark, read_orders, read_orders_for, read_table, watermark_matches
+from features import DATE_FORMAT, customer_features, demand_frame, encode_demand_features, parse_order_dates, recommender_frame
+from recommender import FEATURES
+
+SEED = 42
+REFRESH_ROUNDS = 50
+EARLY_STOPPING_ROUNDS = 10
+HOLDOUT = 0.2
+MIN_HOLDOUT_ROWS = 200
+DEMAND_TREES = 20
+MAX_DEMAND_TREES = 200
+LAG_DAYS = 3
+MIN_DEMAND_ROWS = 50
+
+
+def extend_encoder(le_product, product_names):
+    # New products get the next free ids; refitting would renumber the ids the booster already splits on.
+    product_names = pd.unique(np.asarray(product_names, dtype=object))
+    new_names = product_names[pd.Index(le_product.classes_).get_indexer(product_names) < 0]
+    if len(new_names):
+        le_product.classes_ = np.concatenate([le_product.classes_.astype(object), new_names])
+    return len(new_names)
+
+
+def base_booster(model):
+    booster = model.get_booster() if hasattr(model, 'get_booster') else model
+    best_iteration = booster.attr('best_iteration')
+    if best_iteration is not None:
+        # Trees past the early-stopping point were never used for predictions, so they are dropped
+        # rather than left in front of the new ones.
+        booster = booster[:int(best_iteration) + 1]
+    return booster
+
+
+def continue_boosting(booster, X_train, y_train, X_val, y_val, rounds, workers):
+    # Adds up to rounds trees to a copy of booster, stopping early on the validation rows if there are any.
+    import xgboost as xgb
+    config = json.loads(booster.save_config())
+    tree_params = config['learner']['gradient_booster']['tree_train_param']
+    params = {'objective': config['learner']['objective']['name'], 'eta': float(tree_params['eta']),
+              'max_depth': int(tree_params['max_depth']), 'seed': SEED, 'nthread': workers}
+    feature_names = booster.feature_names or FEATURES
+    dtrain = xgb.DMatrix(X_train, label=y_train, feature_names=feature_names)
+    if not len(X_val):
+        return xgb.train(params, dtrain, num_boost_round=rounds, xgb_model=booster)
+    dval = xgb.DMatrix(X_val, label=y_val, feature_names=feature_names)
+    refreshed = xgb.train(params, dtrain, num_boost_round=rounds, xgb_model=booster, evals=[(dval, 'validation')],
+                          early_stopping_rounds=EARLY_STOPPING_ROUNDS, verbose_eval=False)
+    return refreshed[:refreshed.best_iteration + 1]
+
+
+def refresh_recommender(model, le_product, new_orders, database, rounds, holdout, workers):
+    # Training rows are the new order lines only. Their customer features come from each affected
+    # customer's whole history, as at serving time, which is one indexed read per batch of customers.
+    history = read_orders_for('CustomerID', new_orders['CustomerID'].unique(), database)
+    # Models published from the original offline files may not know every product in older orders.
+    extend_encoder(le_product, history['ProductName'])
+    customers_df = customer_features(history, le_product.transform(history['ProductName']))
+    frame = recommender_frame(new_orders, le_product.transform(new_orders['ProductName']), customers_df)
+    X = frame[FEATURES].to_numpy(dtype=np.float32)
+    y = frame['Quantity'].to_numpy(dtype=np.float32)
+    # A small delta is easy to overfit, so the newest lines are held out to decide how many
+    # rounds to keep. Without enough of them the rounds could not be checked, so none are added.
+    n_val = int(len(frame) * holdout)
+    booster = base_booster(model)
+    report = {'rows': len(frame) - n_val, 'holdout_rows': n_val, 'customers': len(customers_df)}
+    if n_val < MIN_HOLDOUT_ROWS:
+        report.update({'skipped': f"fewer than {MIN_HOLDOUT_ROWS} held-out lines", 'rounds_added': 0,
+                       'total_rounds': booster.num_boosted_rounds()})
+        return booster, report
+    split = len(frame) - n_val
+    refreshed = continue_boosting(booster, X[:split], y[:split], X[split:], y[split:], rounds, workers)
+    mse_before = float(mean_squared_error(y[split:], booster.inplace_predict(X[split:], validate_features=False)))
+    mse_after = float(mean_squared_error(y[split:], refreshed.inplace_predict(X[split:], validate_features=False)))
+    report.update({'holdout_mse_before': mse_before, 'holdout_mse_after': mse_after})
+    if mse_after >= mse_before:
+        refreshed = booster
+    report.update({'rounds_added': refreshed.num_boosted_rounds() - booster.num_boosted_rounds(),
+                   'total_rounds': refreshed.num_boosted_rounds()})
+    return refreshed, report
+
+
+def demand_params(metadata):
+    params = dict(metadata.get('demand', {}).get('best', {}).get('params', {}))
+    params.pop('n_estimators', None)
+    return params
+
+
+def refresh_demand(demand_model, new_orders, products_df, database, params, n_trees, max_trees, holdout, workers,
+                   upto_rowid=None):
+    # The days that received new orders are re-aggregated in full, together with the LAG_DAYS
+    # before each so the lag features have history. Lags only look inside that window, so a
+    # product's first day in it can see shorter lags than a full retrain would give it.
+    # Rows are encoded with the encoding the model was trained with, as forecast_demand does.
+    # A version published without one gets one fitted once over the whole history, which the
+    # refreshed versions keep. The newest days are held out to check the new trees, which are
+    # not added if they make those days worse.
+    report = {}
+    if demand_model.encoding is None:
+        _, demand_model.encoding = encode_demand_features(demand_frame(read_orders(0, upto_rowid, database), products_df))
+        report['encoding'] = "fitted on the whole history"
+    days = pd.DatetimeIndex(sorted(parse_order_dates(pd.Series(new_orders['OrderDate'].unique()))))
+    window = pd.DatetimeIndex(sorted({day - pd.Timedelta(days=lag) for day in days for lag in range(LAG_DAYS + 1)}))
+    merged_df = demand_frame(read_orders_for('OrderDate', window.strftime(DATE_FORMAT), database), products_df)
+    merged_df = merged_df[merged_df['OrderDate'].isin(days)].reset_index(drop=True)
+    X_scaled, _ = encode_demand_features(merged_df, demand_model.encoding)
+    n_val_days = int(np.ceil(len(days) * holdout)) if len(days) > 1 else 0
+    fit_days, val_days = days[:len(days) - n_val_days], days[len(days) - n_val_days:]
+    fit_mask = merged_df['OrderDate'].isin(fit_days).to_numpy()
+    val_mask = merged_df['OrderDate'].isin(val_days).to_numpy()
+    y = merged_df['Quantity'].to_numpy()
+    report.update({'window_days': len(window), 'days': len(fit_days), 'holdout_days': n_val_days,
+                   'rows': int(fit_mask.sum()), 'holdout_rows': int(val_mask.sum())})
+    if report['rows'] < MIN_DEMAND_ROWS:
+        report['skipped'] = f"fewer than {MIN_DEMAND_ROWS} product-days"
+        return demand_model, report
+    forest = RandomForestRegressor(n_estimators=n_trees, random_state=SEED, n_jobs=workers, **params)
+    forest.fit(X_scaled[fit_mask], y[fit_mask])
+    extended = demand_model.extend(model_registry.PackedForest.from_estimator(forest), max_trees)
+    if val_mask.any():
+        mse_before = float(mean_squared_error(y[val_mask], demand_model.predict(X_scaled[val_mask])))
+        mse_after = float(mean_squared_error(y[val_mask], extended.predict(X_scaled[val_mask])))
+        report.update({'holdout_mse_before': mse_before, 'holdout_mse_after': mse_after})
+        if mse_after >= mse_before:
+            extended = demand_model
+    report.update({'trees_added': 0 if extended is demand_model else n_trees, 'total_trees': len(extended.roots)})
+    return extended, report
+
+
+def refresh(database=DATABASE, registry_dir=model_registry.REGISTRY_DIR, since_rowid=None, rounds=REFRESH_ROUNDS,
+            demand_trees=DEMAND_TREES, max_demand_trees=MAX_DEMAND_TREES, min_orders=1, holdout=HOLDOUT, workers=1):
+    # Returns the refreshed models and a report, or None for the models when there is nothing new.
+    version = model_registry.current_version(registry_dir)
+    if version is None:
+        raise ValueError("No active model version to refresh; publish one with train.py first")
+    metadata = model_registry.read_metadata(version, registry_dir)
+    watermark = metadata.get('watermark')
+    if since_rowid is None:
+        if watermark is None:
+            raise ValueError(f"Version {version} has no orders watermark; pass --since-rowid")
+        if not watermark_matches(watermark, database):
+            raise ValueError(f"The Orders table no longer matches the watermark of {version}; retrain with train.py")
+        since_rowid = watermark['rowid']
+
+    start = time.perf_counter()
+    ensure_indexes(database)
+    new_watermark = orders_watermark(database)
+    new_orders = read_orders(since_rowid, new_watermark['rowid'] if new_watermark else since_rowid, database)
+    report = {'database': os.path.abspath(database), 'refreshed_from': version,
+              'base_version': metadata.get('base_version', version), 'since_rowid': since_rowid,
+              'watermark': new_watermark, 'new_orders': len(new_orders), 'timings': {}}
+    if len(new_orders) < min_orders:
+        return None, report
+
+    model, demand_model, le_product = model_registry.load_version(version, registry_dir)
+    products_df = read_table("ProductsOnWebsite", database)
+    report['new_products'] = extend_encoder(le_product, np.concatenate([new_orders['ProductName'].to_numpy(dtype=object),
+                                                                        products_df['ProductName'].to_numpy(dtype=object)]))
+    report['timings']['load'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    booster, report['recommender'] = refresh_recommender(model, le_product, new_orders, database, rounds, holdout, workers)
+    report['timings']['recommender'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    params = demand_params(metadata)
+    demand_model, report['demand'] = refresh_demand(demand_model, new_orders, products_df, database, params, demand_trees,
+                                                    max_demand_trees, holdout, workers, new_watermark['rowid'])
+    report['demand']['best'] = {'params': params}
+    report['timings']['demand'] = time.perf_counter() - start
+    return (booster, demand_model, le_product), report
+
+
+def print_report(report):
+    print(f"{report['new_orders']:,} new order lines since rowid {report['since_rowid']} "
+          f"({report.get('new_products', 0)} new products), refreshing {report['refreshed_from']}")
+    rec = report['recommender']
+    if 'skipped' in rec:
+        print(f"recommender  unchanged: {rec['skipped']} ({rec['total_rounds']} rounds)")
+    else:
+        print(f"recommender  +{rec['rounds_added']} rounds ({rec['total_rounds']} total) on {rec['rows']:,} rows  "
+              f"holdout mse {rec['holdout_mse_before']:.4f} -> {rec['holdout_mse_after']:.4f}")
+    demand = report['demand']
+    if 'encoding' in demand:
+        print(f"demand       no saved feature encoding, {demand['encoding']}")
+    if 'skipped' in demand:
+        print(f"demand       unchanged: {demand['skipped']}")
+    else:
+        holdout = (f"  holdout mse {demand['holdout_mse_before']:.4f} -> {demand['holdout_mse_after']:.4f} "
+                   f"on {demand['holdout_days']} days" if demand['holdout_days'] else "  (one day, nothing held out)")
+        print(f"demand       +{demand['trees_added']} trees ({demand['total_trees']} total) on {demand['rows']:,} product-days{holdout}")
+    print("Timings: " + ", ".join(f"{stage}={seconds:.1f}s" for stage, seconds in report['timings'].items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Update the active models with orders placed since they were trained, "
+                                                 "and publish the result as a new version.")
+    parser.add_argument('--database', default=DATABASE)
+    parser.add_argument('--registry', default=model_registry.REGISTRY_DIR)
+    parser.add_argument('--since-rowid', type=int, help="Use orders after this Orders rowid instead of the version's watermark")
+    parser.add_argument('--rounds', type=int, default=REFRESH_ROUNDS, help="Boosting rounds added to the recommender")
+    parser.add_argument('--demand-trees', type=int, default=DEMAND_TREES, help="Trees fitted on the days with new orders")
+    parser.add_argument('--max-demand-trees', type=int, default=MAX_DEMAND_TREES, help="Oldest trees beyond this are dropped")
+    parser.add_argument('--min-orders', type=int, default=1, help="Do nothing below this many new order lines")
+    parser.add_argument('--holdout', type=float, default=HOLDOUT, help="Newest fraction of the new lines (and days) held out to check the refresh")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--version', help="Registry version name (defaults to a timestamp)")
+    parser.add_argument('--no-activate', action='store_true', help="Publish without pointing the app at the new version")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    models, report = refresh(args.database, args.registry, args.since_rowid, args.rounds, args.demand_trees,
+                             args.max_demand_trees, args.min_orders, args.holdout, args.workers)
+    if models is None:
+        print(f"{report['new_orders']} new order lines since rowid {report['since_rowid']}; nothing to do")
+        return
+    report['timings']['total'] = time.perf_counter() - start
+    version = model_registry.publish(*models, args.registry, args.version, report, activate=not args.no_activate)
+    print_report(report)
+    print(f"Published {version}{'' if args.no_activate else ' (active)'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+import argparse
+import json
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
+
+import metrics
+import operations
+from db import DATABASE, ensure_indexes, read_customer_orders, read_table
+from metrics import API_REQUEST
+from models import ModelsUnavailable, get_models, loaded_version, warm_models_async
+
+# Workers are separate processes, so each keeps its own caches. Writes made
+# through a worker invalidate its caches at once; other workers see catalogue
+# changes within CATALOG_TTL seconds and new orders in the forecast within
+# FORECAST_TTL seconds.
+CATALOG_TTL = 5.0
+FORECAST_TTL = 60.0
+DEFAULT_PER_PAGE = 42
+MAX_PER_PAGE = 500
+
+
+class Cached:
+    def __init__(self, load, ttl):
+        self.load = load
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._value = None
+        self._loaded_at = None
+
+    def get(self):
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+                self._value = self.load()
+                self._loaded_at = time.monotonic()
+            return self._value
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+
+class Store:
+    def __init__(self, database=DATABASE):
+        self.database = database
+        self.products = Cached(lambda: read_table("ProductsOnWebsite", database), CATALOG_TTL)
+        self.forecast = Cached(self._forecast, FORECAST_TTL)
+
+    def _forecast(self):
+        _, demand_model, _ = get_models()
+        merged_df = operations.forecast_demand(read_table("Orders", self.database), self.products.get(), demand_model)
+        return merged_df[['ProductName', 'OrderDate', 'Predict Demand Score']]
+
+    def browse(self, category, query, page, per_page):
+        filtered = operations.filter_products(self.products.get(), category, query)
+        return len(filtered), filtered.iloc[(page - 1) * per_page:page * per_page]
+
+    def categories(self):
+        return sorted(self.products.get()['Category'].dropna().unique().tolist())
+
+    def add_product(self, product):
+        # Writes validate against a fresh catalogue, since another worker may have changed it.
+        self.products.invalidate()
+        errors = operations.product_errors(product, self.products.get()['ProductName'].values)
+        if not errors:
+            operations.add_product(product, self.database)
+            self.products.invalidate()
+        return errors
+
+    def update_product(self, name, quantity, changes):
+        # Returns the validation errors, or None if no such product exists.
+        changes = {column: changes.get(column) for column in operations.EDITABLE_PRODUCT_COLUMNS}
+        self.products.invalidate()
+        errors = operations.product_errors(changes, self.products.get()['ProductName'].values, name)
+        if errors:
+            return errors
+        updated = operations.update_product(name, quantity, changes['ProductName'], changes['Price'], changes['DiscountPrice'],
+                                            changes['Image_Url'], self.database)
+        self.products.invalidate()
+        return errors if updated else None
+
+    def delete_product(self, name, quantity):
+        deleted = operations.delete_product(name, quantity, self.database)
+        self.products.invalidate()
+        return deleted
+
+    def price_cart(self, cart):
+        return operations.price_cart(cart, self.products.get())
+
+    def checkout(self, customer_id, cart):
+        cart_items_data, total_cost = self.price_cart(cart)
+        order_id = operations.place_order(customer_id, cart_items_data, self.database)
+        self.forecast.invalidate()
+        return order_id, cart_items_data, total_cost
+
+    def history(self, customer_id):
+        return operations.order_history(read_customer_orders(customer_id, self.database), customer_id)
+
+    def recommend(self, customer_id, k):
+        model, _, le_product = get_models()
+        return operations.recommend_products(read_customer_orders(customer_id, self.database), self.products.get(),
+                                             customer_id, model, le_product, k)
+
+
+def frame_json(df):
+    # pandas writes NaN as null, which the stdlib encoder used by JSONResponse refuses to do.
+    return json.loads(df.to_json(orient='records', date_format='iso'))
+
+
+def error(status, message, **extra):
+    return JSONResponse({'error': message, **extra}, status_code=status)
+
+
+def positive_int(value, default, maximum=None):
+    try:
+        number = int(value) if value is not None else default
+    except ValueError:
+        return None
+    if number < 1:
+        return None
+    return min(number, maximum) if maximum else number
+
+
+async def read_json(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        return None
+    return body if isinstance(body, dict) else None
+
+
+def cart_items_json(cart_items_data):
+    return [{'ProductName': name, 'Quantity': quantity, 'UnitPrice': float(price), 'Total': float(total)}
+            for name, quantity, price, total in cart_items_data]
+
+
+async def health(request):
+    return JSONResponse({'status': 'ok', 'models': loaded_version(), 'pid': os.getpid()})
+
+
+async def metrics_endpoint(request):
+    return PlainTextResponse(metrics.render_prometheus(), media_type='text/plain; version=0.0.4')
+
+
+async def categories(request):
+    return JSONResponse(await run_in_threadpool(request.app.state.store.categories))
+
+
+async def list_products(request):
+    params = request.query_params
+    page = positive_int(params.get('page'), 1)
+    per_page = positive_int(params.get('per_page'), DEFAULT_PER_PAGE, MAX_PER_PAGE)
+    if page is None or per_page is None:
+        return error(400, "page and per_page must be positive integers")
+    total, products_df = await run_in_threadpool(request.app.state.store.browse, params.get('category'), params.get('q'), page, per_page)
+    return JSONResponse({'total': total, 'page': page, 'per_page': per_page, 'items': frame_json(products_df)})
+
+
+async def create_product(request):
+    product = await read_json(request)
+    if product is None:
+        return error(400, "Expected a JSON object")
+    missing = [column for column in operations.PRODUCT_COLUMNS if column not in product]
+    if missing:
+        return error(400, "Missing fields", fields=missing)
+    errors = await run_in_threadpool(request.app.state.store.add_product, product)
+    if errors:
+        return error(400, "Invalid product", errors=errors)
+    return JSONResponse({column: product[column] for column in operations.PRODUCT_COLUMNS}, status_code=201)
+
+
+async def change_product(request):
+    name, quantity = request.query_params.get('name'), request.query_params.get('quantity')
+    if not name or not quantity:
+        return error(400, "name and quantity query parameters are required")
+    store = request.app.state.store
+    if request.method == 'DELETE':
+        deleted = await run_in_threadpool(store.delete_product, name, quantity)
+        return Response(status_code=204) if deleted else error(404, "No such product")
+    changes = await read_json(request)
+    if changes is None:
+        return error(400, "Expected a JSON object")
+    errors = await run_in_threadpool(store.update_product, name, quantity, changes)
+    if errors is None:
+        return error(404, "No such product")
+    if errors:
+        return error(400, "Invalid product", errors=errors)
+    return JSONResponse({column: changes.get(column) for column in operations.EDITABLE_PRODUCT_COLUMNS})
+
+
+async def read_cart(request):
+    body = await read_json(request)
+    cart = body.get('cart') if body else None
+    if not isinstance(cart, list) or not cart or not all(isinstance(item, str) for item in cart):
+        return None
+    return cart
+
+
+async def price_cart(request):
+    cart = await read_cart(request)
+    if cart is None:
+        return error(400, "Expected {\"cart\": [product names]}")
+    try:
+        cart_items_data, total_cost = await run_in_threadpool(request.app.state.store.price_cart, cart)
+    except KeyError as e:
+        return error(400, e.args[0])
+    return JSONResponse({'items': cart_items_json(cart_items_data), 'total': float(total_cost)})
+
+
+async def customer_orders(request):
+    customer_id = request.path_params['customer_id']
+    store = request.app.state.store
+    if request.method == 'GET':
+        history = await run_in_threadpool(store.history, customer_id)
+        return JSONResponse([{'OrderID': order_id, 'OrderDate': order_date.isoformat(), 'items': frame_json(details.drop(columns='OrderDate'))}
+                             for order_id, order_date, details in history])
+    cart = await read_cart(request)
+    if cart is None:
+        return error(400, "Expected {\"cart\": [product names]}")
+    try:
+        order_id, cart_items_data, total_cost = await run_in_threadpool(store.checkout, customer_id, cart)
+    except KeyError as e:
+        return error(400, e.args[0])
+    return JSONResponse({'OrderID': order_id, 'items': cart_items_json(cart_items_data), 'total': float(total_cost)}, status_code=201)
+
+
+async def recommendations(request):
+    k = positive_int(request.query_params.get('k'), 10, MAX_PER_PAGE)
+    if k is None:
+        return error(400, "k must be a positive integer")
+    try:
+        recommended = await run_in_threadpool(request.app.state.store.recommend, request.path_params['customer_id'], k)
+    except ModelsUnavailable as e:
+        return error(503, f"Models unavailable: {e}")
+    return JSONResponse([] if recommended is None else frame_json(recommended))
+
+
+async def forecast(request):
+    try:
+        merged_df = await run_in_threadpool(request.app.state.store.forecast.get)
+    except ModelsUnavailable as e:
+        return error(503, f"Models unavailable: {e}")
+    return JSONResponse(frame_json(merged_df))
+
+
+class RequestMetrics:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        status = {'code': 500}
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Labelled by route template, not the raw path, so customer ids do not become series.
+            route = scope.get('route')
+            API_REQUEST.observe(time.perf_counter() - start, route=route.path if route else 'unmatched',
+                                method=scope['method'], status=str(status['code']))
+
+
+def create_app(database=None):
+    database = database or os.environ.get('FRESH_MARKET_DATABASE', DATABASE)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        await run_in_threadpool(ensure_indexes, database)
+        warm_models_async()
+        yield
+
+    app = Starlette(routes=[
+        Route('/health', health),
+        Route('/metrics', metrics_endpoint),
+        Route('/categories', categories),
+        Route('/products', list_products, methods=['GET']),
+        Route('/products', create_product, methods=['POST']),
+        Route('/products', change_product, methods=['PUT', 'DELETE']),
+        Route('/cart/price', price_cart, methods=['POST']),
+        Route('/customers/{customer_id}/orders', customer_orders, methods=['GET', 'POST']),
+        Route('/customers/{customer_id}/recommendations', recommendations),
+        Route('/forecast', forecast),
+    ], lifespan=lifespan)
+    app.state.store = Store(database)
+    return RequestMetrics(app)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the shop's catalogue, checkout, recommendations and forecasts over HTTP.")
+    parser.add_argument('--database', default=DATABASE)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes sharing the listening socket")
+    args = parser.parse_args()
+
+    import uvicorn
+    # Worker processes import the app afresh, so the database is passed through the environment.
+    os.environ['FRESH_MARKET_DATABASE'] = args.database
+    uvicorn.run('service:create_app', factory=True, host=args.host, port=args.port, workers=args.workers,
+                log_level='warning', access_log=False)
+
+
+if __name__ == '__main__':
+    main()
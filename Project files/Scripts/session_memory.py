@@ -0,0 +1,193 @@
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from streamlit.runtime.state.session_state import SessionState
+
+SESSION_TTL = 60 * 60
+EVICT_AFTER = 5 * 60
+SWEEP_INTERVAL = 60
+# Keys every page that reads them rebuilds first, so an idle session can do without them.
+RECOMPUTABLE_KEYS = ('filtered_products_df', 'previous_rerun_stats')
+
+
+def object_bytes(value, seen=None):
+    # Deep size in bytes. Objects whose ids are already in seen count as 0, which is how
+    # frames shared between sessions are left out of each session's total.
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(object_bytes(key, seen) + object_bytes(item, seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(object_bytes(item, seen) for item in value)
+    return size
+
+
+class SharedTables:
+    # One copy of each table per process, handed to every session instead of a copy each.
+    # Frames are replaced on reload and never modified, so callers must not change them in place.
+    # versions maps a table to a cheap function whose result changes when the table does.
+    def __init__(self, load, versions=None):
+        self.load = load
+        self.versions = versions or {}
+        self._lock = threading.Lock()
+        self._tables = {}
+
+    def get(self, name):
+        version = self.versions[name]() if name in self.versions else None
+        with self._lock:
+            entry = self._tables.get(name)
+            if entry is None or entry[0] != version:
+                entry = self._tables[name] = (version, self.load(name))
+            return entry[1]
+
+    def refresh(self, name):
+        # For writes made by this process; the version is read first so a concurrent
+        # change is picked up again by the next get.
+        version = self.versions[name]() if name in self.versions else None
+        with self._lock:
+            frame = self.load(name)
+            self._tables[name] = (version, frame)
+            return frame
+
+    def frames(self):
+        with self._lock:
+            return {name: frame for name, (_, frame) in self._tables.items()}
+
+    def nbytes(self):
+        return sum(object_bytes(frame) for frame in self.frames().values())
+
+
+def session_state_of(state):
+    # st.session_state is a SafeSessionState that keeps the session's SessionState in the private
+    # _state attribute (Streamlit 1.66.0). If an upgrade moves it, stop here: tracking the per-run
+    # wrapper instead would quietly turn off eviction and expiry.
+    inner = getattr(state, '_state', state)
+    if not isinstance(inner, SessionState):
+        raise TypeError(f"expected a SessionState inside {type(state).__name__}, got {type(inner).__name__}; "
+                        "SessionRegistry was written against Streamlit 1.66.0")
+    return inner
+
+
+class SessionRegistry:
+    # Tracks live sessions by their SessionState. Streamlit hands each rerun a new wrapper around
+    # it, so the state itself is held, and a session is dropped once is_active(session_id) says
+    # the runtime has closed it. Sessions idle for evict_after seconds lose their recomputable
+    # keys; after session_ttl their state is cleared, which logs them out.
+    def __init__(self, session_ttl=SESSION_TTL, evict_after=EVICT_AFTER, recomputable_keys=RECOMPUTABLE_KEYS,
+                 sweep_interval=SWEEP_INTERVAL, is_active=None):
+        self.session_ttl = session_ttl
+        self.evict_after = evict_after
+        self.recomputable_keys = recomputable_keys
+        self.sweep_interval = sweep_interval
+        self.is_active = is_active or (lambda session_id: True)
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._last_sweep = time.monotonic()
+        self.evicted = 0
+        self.expired = 0
+
+    @contextmanager
+    def active(self, session_id, state):
+        # Wraps one rerun of a session. Its lock is held until the rerun ends, and a sweep only
+        # changes a session's state while it holds that lock, so never under a running script.
+        state = session_state_of(state)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or entry['state'] is not state:
+                entry = self._sessions[session_id] = {'state': state, 'lock': threading.RLock(), 'last_seen': now}
+            due = now - self._last_sweep >= self.sweep_interval
+            if due:
+                self._last_sweep = now
+        with entry['lock']:
+            # A sweep can miss keys that Streamlit restores as a rerun starts, so an expired
+            # session is cleared again here, by its own rerun.
+            if now - entry['last_seen'] > self.session_ttl:
+                self._expire(entry)
+            entry.update(last_seen=now, expired=False)
+            if due:
+                self.sweep(now)
+            try:
+                yield
+            finally:
+                entry['last_seen'] = time.monotonic()
+
+    def _entries(self):
+        with self._lock:
+            return list(self._sessions.items())
+
+    def _expire(self, entry):
+        state = entry['state']
+        for key in list(state.filtered_state):
+            del state[key]
+        if not entry.get('expired'):
+            entry['expired'] = True
+            self.expired += 1
+
+    def sweep(self, now=None):
+        # Sessions in the middle of a rerun are skipped; they are not idle.
+        now = time.monotonic() if now is None else now
+        for session_id, entry in self._entries():
+            if not self.is_active(session_id):
+                with self._lock:
+                    if self._sessions.get(session_id) is entry:
+                        del self._sessions[session_id]
+                continue
+            idle = now - entry['last_seen']
+            if idle <= self.evict_after or not entry['lock'].acquire(blocking=False):
+                continue
+            try:
+                state = entry['state']
+                if idle > self.session_ttl:
+                    if not entry.get('expired'):
+                        self._expire(entry)
+                else:
+                    for key in self.recomputable_keys:
+                        if key in state:
+                            del state[key]
+                            self.evicted += 1
+            finally:
+                entry['lock'].release()
+
+    def usage(self, shared=()):
+        # Bytes held by each live session, largest first, not counting the shared objects.
+        # Sessions in the middle of a rerun, other than the caller's, are left out.
+        now = time.monotonic()
+        shared_ids = {id(value) for value in shared}
+        rows = []
+        for session_id, entry in self._entries():
+            if not self.is_active(session_id) or not entry['lock'].acquire(blocking=False):
+                continue
+            try:
+                state = entry['state']
+                seen = set(shared_ids)
+                keys = {key: object_bytes(value, seen) for key, value in state.filtered_state.items()}
+                user = state['username'] if 'username' in state else None
+            finally:
+                entry['lock'].release()
+            largest = max(keys, key=keys.get) if keys else None
+            rows.append({'session': session_id[:8], 'user': user, 'idle_seconds': now - entry['last_seen'],
+                         'keys': len(keys), 'bytes': sum(keys.values()), 'largest_key': largest,
+                         'largest_key_bytes': keys[largest] if largest else 0})
+        return sorted(rows, key=lambda row: -row['bytes'])
+
+
+def capacity(usage_rows, shared_bytes, budget_bytes):
+    # Sessions like the current ones that fit in budget_bytes next to one set of shared tables.
+    if not usage_rows:
+        return None
+    per_session = max(sum(row['bytes'] for row in usage_rows) / len(usage_rows), 1)
+    return max(int((budget_bytes - shared_bytes) // per_session), 0)
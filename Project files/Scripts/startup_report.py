@@ -0,0 +1,120 @@
+import argparse
+import ast
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+import pandas as pd
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(SCRIPTS_DIR, '..', 'Data files')
+DEFERRED_MODULES = ['xgboost', 'sklearn.preprocessing', 'joblib', 'matplotlib.pyplot']
+
+RENDER_SNIPPET = """
+import time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file({script!r}, default_timeout=120)
+app.run()
+elapsed = time.perf_counter() - start
+assert not app.exception, app.exception
+assert app.title[0].value == 'Login'
+print(elapsed)
+"""
+
+
+def top_level_imports(path):
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            modules.append(node.module)
+    return modules
+
+
+def time_import(modules, cwd=SCRIPTS_DIR):
+    code = "import time, importlib\nstart = time.perf_counter()\n"
+    code += "".join(f"importlib.import_module({m!r})\n" for m in modules)
+    code += "print(time.perf_counter() - start)"
+    result = subprocess.run([sys.executable, '-c', code], cwd=cwd, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip())
+
+
+def build_fixture(directory):
+    with sqlite3.connect(os.path.join(directory, 'BigBasket.db')) as conn:
+        pd.read_csv(os.path.join(DATA_DIR, 'managers.csv')).to_sql('managers', conn, index=False)
+        pd.read_csv(os.path.join(DATA_DIR, 'customers.csv')).to_sql('customers', conn, index=False)
+        pd.read_csv(os.path.join(DATA_DIR, 'ProductsOnWebsite.csv')).to_sql('ProductsOnWebsite', conn, index=False)
+        conn.execute("CREATE TABLE Orders (CustomerID TEXT, OrderID TEXT, ProductName TEXT, Quantity INTEGER, OrderDate TEXT, Price REAL)")
+    shutil.copy(os.path.join(DATA_DIR, 'bb.jpeg'), directory)
+    build_stand_in_models(directory)
+
+
+def build_stand_in_models(directory):
+    # Small models with the production feature layout, so builds that load models at startup can render too.
+    import pickle
+    import joblib
+    import numpy as np
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.preprocessing import LabelEncoder
+    from xgboost import XGBRegressor
+    rng = np.random.default_rng(42)
+    le_product = LabelEncoder().fit(pd.read_csv(os.path.join(DATA_DIR, 'ProductsOnWebsite.csv'))['ProductName'])
+    X = rng.random((2000, 6))
+    y = rng.integers(1, 6, 2000)
+    XGBRegressor(n_estimators=200, max_depth=3).fit(X, y).save_model(os.path.join(directory, 'xgb_model.json'))
+    X = rng.random((2000, 14))
+    joblib.dump(RandomForestRegressor(n_estimators=100, random_state=42).fit(X, y), os.path.join(directory, 'best_random_forest_model_with_lags.pkl'))
+    with open(os.path.join(directory, 'label_encoder.pkl'), 'wb') as f:
+        pickle.dump(le_product, f)
+
+
+def time_first_render(script, cwd):
+    result = subprocess.run([sys.executable, '-c', RENDER_SNIPPET.format(script=script)], cwd=cwd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def median_of(fn, repeat):
+    samples = sorted(fn() for _ in range(repeat))
+    return samples[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time and time-to-first-render of the Fresh Market app.")
+    parser.add_argument('--script', default=os.path.join(SCRIPTS_DIR, 'project.py'))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="Write the report as JSON to this path")
+    args = parser.parse_args()
+    script = os.path.abspath(args.script)
+
+    eager = top_level_imports(script)
+    report = {
+        'top_level_imports': eager,
+        'import_seconds': median_of(lambda: time_import(eager), args.repeat),
+        'deferred_import_seconds': {m: median_of(lambda: time_import([m]), args.repeat) for m in DEFERRED_MODULES},
+    }
+    with tempfile.TemporaryDirectory() as fixture_dir:
+        build_fixture(fixture_dir)
+        report['first_render_seconds'] = median_of(lambda: time_first_render(script, fixture_dir), args.repeat)
+
+    print(f"Top-level imports: {', '.join(eager)}")
+    print(f"Import time:              {report['import_seconds']:.3f}s")
+    for module, seconds in report['deferred_import_seconds'].items():
+        print(f"  deferred {module:<22} {seconds:.3f}s")
+    print(f"Time to first render:     {report['first_render_seconds']:.3f}s")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
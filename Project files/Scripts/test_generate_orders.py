@@ -0,0 +1,43 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from generate_orders import ORDER_COLUMNS, OrderGenerator, SQLiteSink
+
+PRODUCTS = pd.DataFrame({'ProductName': ['Onion', 'Tomato'], 'DiscountPrice': [40.0, 25.0]})
+
+
+def generate(database, replace=False):
+    generator = OrderGenerator(PRODUCTS, customers=3, orders_per_customer=2, items_per_order=(1, 2), seed=0)
+    sink = SQLiteSink(database, PRODUCTS, generator.customers, replace=replace)
+    for chunk in generator.chunks(2):
+        sink.write(chunk)
+    sink.close()
+
+
+def order_lines(database):
+    with sqlite3.connect(database) as conn:
+        return pd.read_sql("SELECT * FROM Orders", conn)
+
+
+def test_generated_orders_are_not_appended_to_existing_ones(tmp_path):
+    database = str(tmp_path / 'shop.db')
+    with sqlite3.connect(database) as conn:
+        conn.execute(f"CREATE TABLE Orders ({', '.join(ORDER_COLUMNS)})")
+        conn.execute("INSERT INTO Orders VALUES ('c1', 'c1-1', 'Onion', 1, '01/02/2024', 40.0)")
+    with pytest.raises(ValueError, match='--replace'):
+        generate(database)
+    assert len(order_lines(database)) == 1
+
+    generate(database, replace=True)
+    orders = order_lines(database)
+    assert set(orders['CustomerID']) == {'c1', 'c2', 'c3'} and orders['OrderID'].nunique() == 6
+
+
+def test_an_empty_orders_table_is_filled(tmp_path):
+    database = str(tmp_path / 'shop.db')
+    with sqlite3.connect(database) as conn:
+        conn.execute(f"CREATE TABLE Orders ({', '.join(ORDER_COLUMNS)})")
+    generate(database)
+    assert order_lines(database)['OrderID'].nunique() == 6
@@ -0,0 +1,100 @@
+import io
+import os
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from image_cache import ThumbnailCache
+
+
+def image_bytes(color='red', size=(640, 480)):
+    out = io.BytesIO()
+    Image.new('RGB', size, color).save(out, format='PNG')
+    return out.getvalue()
+
+
+class StubFetcher:
+    def __init__(self, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, url):
+        with self._lock:
+            self.calls.append(url)
+        time.sleep(self.delay)
+        if self.fail:
+            raise OSError(f"cannot fetch {url}")
+        return image_bytes()
+
+
+@pytest.fixture
+def make_cache(tmp_path):
+    caches = []
+
+    def make(fetcher, **kwargs):
+        cache = ThumbnailCache(cache_dir=str(tmp_path / 'thumbnails'), fetcher=fetcher, **kwargs)
+        caches.append(cache)
+        return cache
+    yield make
+    for cache in caches:
+        cache._executor.shutdown(wait=True)
+
+
+def test_hit_is_served_from_disk_without_refetching(make_cache):
+    fetcher = StubFetcher()
+    cache = make_cache(fetcher)
+    path = cache.get('http://img/a.jpg', 150)
+    assert os.path.isfile(path)
+    assert max(Image.open(path).size) <= 150
+    assert cache.get('http://img/a.jpg', 150) == path
+    assert fetcher.calls == ['http://img/a.jpg']
+
+
+def test_failures_fall_back_to_the_url_and_are_not_retried_until_the_ttl(make_cache):
+    fetcher = StubFetcher(fail=True)
+    cache = make_cache(fetcher, failure_ttl=0.5)
+    urls = [f'http://img/{i}.jpg' for i in range(5)]
+    for _ in range(3):
+        assert cache.get_many(urls) == urls
+    assert len(fetcher.calls) == 5
+
+    time.sleep(0.6)
+    fetcher.fail = False
+    assert all(os.path.isfile(path) for path in cache.get_many(urls))
+
+
+def test_misses_are_fetched_in_parallel_within_the_deadline(make_cache):
+    fetcher = StubFetcher(delay=0.3)
+    cache = make_cache(fetcher, fetch_workers=8, deadline=5.0)
+    urls = [f'http://img/{i}.jpg' for i in range(8)]
+    start = time.perf_counter()
+    paths = cache.get_many(urls)
+    assert time.perf_counter() - start < 8 * 0.3
+    assert all(os.path.isfile(path) for path in paths)
+
+
+def test_slow_fetches_return_the_url_and_finish_in_the_background(make_cache):
+    fetcher = StubFetcher(delay=0.5)
+    cache = make_cache(fetcher, deadline=0.05)
+    start = time.perf_counter()
+    assert cache.get_many(['http://img/slow.jpg', float('nan')]) == ['http://img/slow.jpg', pytest.approx(float('nan'), nan_ok=True)]
+    assert time.perf_counter() - start < 0.4
+    cache._executor.shutdown(wait=True)
+    assert os.path.isfile(cache.get('http://img/slow.jpg'))
+    assert len(fetcher.calls) == 1
+
+
+def test_least_recently_used_thumbnails_are_evicted(make_cache):
+    cache = make_cache(StubFetcher())
+    first = cache.get('http://img/first.jpg')
+    entry_bytes = os.path.getsize(first)
+    cache.max_bytes = entry_bytes * 2
+    second = cache.get('http://img/second.jpg')
+    cache.get('http://img/first.jpg')
+    cache.get('http://img/third.jpg')
+    assert os.path.isfile(first)
+    assert not os.path.exists(second)
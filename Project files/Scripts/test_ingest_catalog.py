@@ -0,0 +1,83 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from ingest_catalog import CATALOG_COLUMNS, ingest
+
+EXISTING = [
+    ('Onion (Loose)', 'Fresho', 40.0, 35.0, 'http://img/onion.jpg', '1 kg', 'Vegetables', 'Onion', 'http://shop/onion'),
+    ('Tomato', 'Fresho', 30.0, 25.0, 'http://img/tomato.jpg', '500 g', 'Vegetables', 'Tomato', 'http://shop/tomato'),
+]
+
+
+def feed_row(name, quantity, price='10', url='http://img/x.jpg'):
+    return {'ProductName': name, 'Brand': 'B', 'Price': price, 'DiscountPrice': '9', 'Image_Url': url,
+            'Quantity': quantity, 'Category': 'Vegetables', 'SubCategory': 'Veg', 'Absolute_Url': 'http://shop/x'}
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / 'shop.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute(f"CREATE TABLE ProductsOnWebsite ({', '.join(CATALOG_COLUMNS)})")
+        conn.executemany(f"INSERT INTO ProductsOnWebsite VALUES ({', '.join('?' * len(CATALOG_COLUMNS))})", EXISTING)
+    return path
+
+
+def run_feed(tmp_path, database, rows, **kwargs):
+    path = tmp_path / 'feed.csv'
+    pd.DataFrame(rows).to_csv(path, index=False)
+    rejects = tmp_path / 'rejects.csv'
+    report = ingest(str(path), database, rejects_path=str(rejects), wal=False, **kwargs)
+    with sqlite3.connect(database) as conn:
+        products = pd.read_sql("SELECT * FROM ProductsOnWebsite", conn)
+    return report, products, pd.read_csv(rejects) if rejects.exists() else pd.DataFrame(columns=['ProductName', 'Error'])
+
+
+def test_existing_names_can_be_updated_but_not_given_another_pack_size(tmp_path, database):
+    report, products, rejects = run_feed(tmp_path, database, [
+        feed_row('Onion (Loose)', '1 kg', price='45'),
+        feed_row('Onion (Loose)', '2 kg'),
+        feed_row('Onion (Loose)', '5 kg'),
+        feed_row('Garlic', '100 g'),
+    ], chunk_rows=2)
+    assert (report['inserted'], report['updated'], report['rejected']) == (1, 1, 2)
+    assert products['ProductName'].is_unique
+    assert products.loc[products['ProductName'] == 'Onion (Loose)', 'Price'].tolist() == [45.0]
+    assert set(rejects['Error']) == {"Product name already exists. Please use a different name."}
+
+
+def test_a_name_may_appear_only_once_in_the_feed(tmp_path, database):
+    report, products, rejects = run_feed(tmp_path, database, [
+        feed_row('Garlic', '100 g'),
+        feed_row('Garlic', '250 g'),
+        feed_row('Garlic', '100 g'),
+    ], chunk_rows=1)
+    assert (report['inserted'], report['rejected']) == (1, 2)
+    assert products.loc[products['ProductName'] == 'Garlic', 'Quantity'].tolist() == ['100 g']
+    assert set(rejects['Error']) == {"Product appears more than once in the feed."}
+
+
+def test_form_checks_reject_bad_rows_and_dry_run_writes_nothing(tmp_path, database):
+    report, products, rejects = run_feed(tmp_path, database, [
+        feed_row('Leek', '1 pc', price='-1'),
+        feed_row('Kale', '250 g', url='ftp://img/kale.jpg'),
+        feed_row('Okra', '0 g'),
+        feed_row('', '1 kg'),
+        feed_row('Beans', '250 g'),
+    ], dry_run=True)
+    assert (report['valid'], report['rejected']) == (1, 4)
+    assert 'inserted' not in report
+    assert len(products) == len(EXISTING)
+    assert set(rejects['ProductName'].fillna('')) == {'Leek', 'Kale', 'Okra', ''}
+
+
+def test_a_feed_can_fill_a_new_database(tmp_path):
+    report, products, rejects = run_feed(tmp_path, str(tmp_path / 'new.db'), [
+        feed_row('Onion (Loose)', '1 kg', price='45'),
+        feed_row('Tomato', '500 g'),
+    ])
+    assert (report['inserted'], report['updated'], report['rejected']) == (2, 0, 0)
+    assert list(products.columns) == CATALOG_COLUMNS
+    assert products.set_index('ProductName')['Price'].to_dict() == {'Onion (Loose)': 45.0, 'Tomato': 10.0}
@@ -0,0 +1,62 @@
+import logging
+import socket
+
+import pytest
+
+import metrics
+from metrics import COUNT_BUCKETS, Histogram
+
+
+@pytest.fixture
+def histograms(monkeypatch):
+    latency = Histogram('test_render_seconds', "Test latencies.")
+    counts = Histogram('test_queries', "Test counts.", COUNT_BUCKETS)
+    monkeypatch.setattr(metrics, 'HISTOGRAMS', [latency, counts])
+    return latency, counts
+
+
+def test_mixed_label_values_render(histograms):
+    latency, counts = histograms
+    latency.observe(0.02, page=None)
+    latency.observe(0.2, page='Login')
+    latency.observe(0.3, page='Customer:products', status=200)
+    counts.observe(3, page=None)
+
+    text = metrics.render_prometheus()
+    assert 'fresh_market_test_render_seconds_count{page="None"} 1' in text
+    assert 'fresh_market_test_render_seconds_count{page="Login"} 1' in text
+    assert 'fresh_market_test_render_seconds_bucket{page="Customer:products",status="200",le="+Inf"} 1' in text
+
+    rows = metrics.summary_rows()
+    assert [(row['metric'], row['labels']) for row in rows] == [
+        ('test_render_seconds', 'page=Customer:products, status=200'),
+        ('test_render_seconds', 'page=Login'),
+        ('test_render_seconds', 'page=None'),
+        ('test_queries', 'page=None'),
+    ]
+    assert latency.quantile(0.5, page=None) == pytest.approx(0.0175)
+    assert latency.quantile(0.5, page='Customer:products', status=200) is not None
+
+
+def test_rerun_counts_statements_and_records_the_page(histograms, monkeypatch):
+    monkeypatch.setattr(metrics, 'PAGE_RENDER', histograms[0])
+    monkeypatch.setattr(metrics, 'QUERIES_PER_RERUN', histograms[1])
+    with metrics.rerun('Login') as stats:
+        metrics.count_query('SELECT 1')
+        metrics.count_query('SELECT 2')
+    metrics.count_query('SELECT 3')
+    assert stats['page'] == 'Login' and stats['queries'] == 2
+    assert histograms[1].series()[(('page', 'Login'),)]['sum'] == 2
+
+
+def test_exporter_is_disabled_once_when_the_port_is_taken(monkeypatch, caplog):
+    monkeypatch.setattr(metrics, '_server', None)
+    monkeypatch.setattr(metrics, '_server_failed', False)
+    with socket.socket() as taken:
+        taken.bind(('127.0.0.1', 0))
+        taken.listen()
+        port = taken.getsockname()[1]
+        with caplog.at_level(logging.WARNING, logger='metrics'):
+            assert metrics.start_http_server(port) is None
+            assert metrics.start_http_server(port) is None
+    assert len(caplog.records) == 1
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.preprocessing import LabelEncoder
+from xgboost import XGBRegressor
+
+import model_registry
+from features import DEMAND_FEATURES, encode_demand_features
+from model_registry import PackedForest
+
+
+@pytest.fixture
+def forest():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(400, len(DEMAND_FEATURES)))
+    y = X[:, 0] * 3 + rng.normal(size=400)
+    return RandomForestRegressor(n_estimators=12, max_depth=6, random_state=0).fit(X, y), X
+
+
+def test_the_demand_encoding_is_published_and_loaded_with_the_forest(tmp_path, forest):
+    rf, X = forest
+    frame = pd.DataFrame(X, columns=DEMAND_FEATURES)
+    for column in ('ProductName', 'Brand', 'Category', 'SubCategory'):
+        frame[column] = [f'{column} {i % 7}' for i in range(len(frame))]
+    _, rf.encoding = encode_demand_features(frame.copy())
+    rng = np.random.default_rng(1)
+    model = XGBRegressor(n_estimators=3).fit(rng.random((50, 6)), rng.random(50))
+    le_product = LabelEncoder().fit(['Onion'])
+
+    version = model_registry.publish(model, rf, le_product, str(tmp_path), 'v1')
+    _, demand_model, _ = model_registry.load_version(version, str(tmp_path))
+    X_expected, _ = encode_demand_features(frame.copy(), rf.encoding)
+    X_loaded, _ = encode_demand_features(frame.copy(), demand_model.encoding)
+    assert np.array_equal(X_loaded, X_expected)
+
+    rf.encoding = None
+    version = model_registry.publish(model, rf, le_product, str(tmp_path), 'v2')
+    assert model_registry.load_version(version, str(tmp_path))[1].encoding is None
+
+
+def test_packed_forest_predicts_what_the_forest_predicts(tmp_path, forest):
+    rf, X = forest
+    packed = PackedForest.from_estimator(rf)
+    np.testing.assert_allclose(packed.predict(X), rf.predict(X), rtol=1e-12)
+    packed.save(str(tmp_path / 'forest.joblib'))
+    np.testing.assert_allclose(PackedForest.load(str(tmp_path / 'forest.joblib')).predict(X), rf.predict(X), rtol=1e-12)
+
+
+def test_extend_keeps_the_newest_trees(forest):
+    rf, X = forest
+    rng = np.random.default_rng(2)
+    newer = RandomForestRegressor(n_estimators=5, max_depth=4, random_state=1).fit(X, X[:, 1] + rng.normal(size=len(X)))
+    trees = rf.estimators_ + newer.estimators_
+
+    extended = PackedForest.from_estimator(rf).extend(PackedForest.from_estimator(newer))
+    assert len(extended.roots) == len(trees)
+    np.testing.assert_allclose(extended.predict(X), np.mean([tree.predict(X) for tree in trees], axis=0), rtol=1e-12)
+
+    truncated = PackedForest.from_estimator(rf).extend(PackedForest.from_estimator(newer), max_trees=8)
+    assert len(truncated.roots) == 8 and truncated.roots[0] == 0
+    np.testing.assert_allclose(truncated.predict(X), np.mean([tree.predict(X) for tree in trees[-8:]], axis=0), rtol=1e-12)
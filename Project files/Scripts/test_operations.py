@@ -0,0 +1,77 @@
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.preprocessing import LabelEncoder
+from xgboost import XGBRegressor
+
+import db
+import models
+from operations import place_order, recommend_products
+from recommender import FEATURES
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / 'shop.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE Orders (CustomerID TEXT, OrderID TEXT, ProductName TEXT, Quantity INTEGER, OrderDate TEXT, Price REAL)")
+        conn.execute("INSERT INTO Orders VALUES ('c1', 'c1-1', 'Onion', 1, '01/02/2024', 26.0)")
+    return path
+
+
+def test_concurrent_checkouts_get_distinct_order_ids(database, monkeypatch):
+    # Every SELECT is slowed down, which widens the gap between reading the next id and inserting.
+    def slow_reads(statement):
+        if statement.lstrip().upper().startswith('SELECT'):
+            time.sleep(0.01)
+    monkeypatch.setattr(db, 'count_query', slow_reads)
+    cart = [('Onion', 2, 26.0, 52.0), ('Tomato', 1, 30.0, 30.0)]
+    order_ids = []
+    lock = threading.Lock()
+
+    def checkout(customer):
+        for _ in range(5):
+            order_id = place_order(customer, cart, database)
+            with lock:
+                order_ids.append(order_id)
+
+    threads = [threading.Thread(target=checkout, args=('c1' if i % 2 else 'c2',)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(order_ids) == len(set(order_ids)) == 40
+    with sqlite3.connect(database) as conn:
+        orders = pd.read_sql("SELECT * FROM Orders WHERE rowid > 1", conn)
+    assert (orders.groupby('OrderID').size() == len(cart)).all()
+    assert set(orders['OrderID']) == set(order_ids)
+
+
+def test_missing_model_files_raise_models_unavailable(tmp_path, monkeypatch):
+    monkeypatch.setattr(models, '_models', None)
+    monkeypatch.setattr(models.model_registry, 'current_version', lambda: None)
+    monkeypatch.setattr(models, 'MODEL_PATH', str(tmp_path / 'missing.json'))
+    with pytest.raises(models.ModelsUnavailable):
+        models.get_models()
+
+
+def test_recommendations_leave_out_products_the_encoder_does_not_know():
+    known = [f'Product {i}' for i in range(30)]
+    le_product = LabelEncoder().fit(known)
+    rng = np.random.default_rng(0)
+    model = XGBRegressor(n_estimators=10, max_depth=3).fit(rng.random((300, len(FEATURES))), rng.integers(1, 6, 300))
+    products_df = pd.DataFrame({'ProductName': known + ['New product', 'Another new product', 'Product 3']})
+    orders_df = pd.DataFrame({'CustomerID': ['c1'] * 3, 'OrderID': ['c1-1'] * 3,
+                              'ProductName': ['Product 1', 'New product', 'Product 2'], 'Quantity': [1, 2, 3],
+                              'OrderDate': ['01/02/2024'] * 3, 'Price': [10.0] * 3})
+
+    top = recommend_products(orders_df, products_df, 'c1', model, le_product, k=10)
+    assert len(top) == 10
+    assert top['ProductName'].is_unique
+    assert set(top['ProductName']) <= set(known)
+    assert recommend_products(orders_df, products_df, 'c2', model, le_product) is None
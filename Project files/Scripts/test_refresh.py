@@ -0,0 +1,165 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.preprocessing import LabelEncoder
+from xgboost import XGBRegressor
+
+import refresh
+from db import read_orders
+from features import DEMAND_FEATURES, demand_frame, encode_demand_features
+from model_registry import PackedForest
+from operations import forecast_demand
+from recommender import FEATURES
+
+PRODUCTS = pd.DataFrame({
+    'ProductName': [f'Product {i}' for i in range(20)],
+    'Brand': [f'Brand {i % 4}' for i in range(20)],
+    'Price': np.arange(20) * 5.0 + 10,
+    'DiscountPrice': np.arange(20) * 4.0 + 10,
+    'Category': [f'Category {i % 3}' for i in range(20)],
+    'SubCategory': [f'Sub {i % 6}' for i in range(20)],
+})
+
+
+def make_orders(n_lines, days, seed):
+    rng = np.random.default_rng(seed)
+    products = rng.integers(0, len(PRODUCTS), n_lines)
+    return pd.DataFrame({
+        'CustomerID': [f'c{i}' for i in rng.integers(0, 40, n_lines)],
+        'OrderID': [f'o{seed}-{i}' for i in range(n_lines)],
+        'ProductName': PRODUCTS['ProductName'].to_numpy()[products],
+        'Quantity': rng.integers(1, 6, n_lines),
+        'OrderDate': pd.to_datetime(rng.choice(days, n_lines)).strftime('%d/%m/%Y'),
+        'Price': PRODUCTS['Price'].to_numpy()[products],
+    })
+
+
+@pytest.fixture
+def shop(tmp_path):
+    database = str(tmp_path / 'shop.db')
+    with sqlite3.connect(database) as conn:
+        make_orders(3000, pd.date_range('2024-01-01', '2024-02-29'), seed=1).to_sql('Orders', conn, index=False)
+    rng = np.random.default_rng(0)
+    model = XGBRegressor(n_estimators=30, max_depth=3).fit(rng.random((500, len(FEATURES))), rng.integers(1, 6, 500))
+    forest = RandomForestRegressor(n_estimators=10, random_state=0).fit(rng.random((500, len(DEMAND_FEATURES))), rng.integers(1, 6, 500))
+    return database, model, PackedForest.from_estimator(forest), LabelEncoder().fit(PRODUCTS['ProductName'])
+
+
+def add_orders(database, orders):
+    with sqlite3.connect(database) as conn:
+        orders.to_sql('Orders', conn, index=False, if_exists='append')
+
+
+def test_recommender_is_unchanged_without_enough_held_out_lines(shop):
+    database, model, _, le_product = shop
+    new_orders = make_orders(refresh.MIN_HOLDOUT_ROWS * 4, pd.date_range('2024-03-01', '2024-03-03'), seed=2)
+    add_orders(database, new_orders)
+    booster, report = refresh.refresh_recommender(model, le_product, new_orders, database, refresh.REFRESH_ROUNDS,
+                                                  refresh.HOLDOUT, workers=1)
+    assert 'skipped' in report
+    assert report['rounds_added'] == 0
+    assert booster.num_boosted_rounds() == model.get_booster().num_boosted_rounds()
+
+
+def test_recommender_drops_rounds_that_make_the_held_out_lines_worse(shop, monkeypatch):
+    database, model, _, le_product = shop
+    new_orders = make_orders(refresh.MIN_HOLDOUT_ROWS * 6, pd.date_range('2024-03-01', '2024-03-10'), seed=3)
+    add_orders(database, new_orders)
+    booster, report = refresh.refresh_recommender(model, le_product, new_orders, database, refresh.REFRESH_ROUNDS,
+                                                  refresh.HOLDOUT, workers=1)
+    assert report['holdout_rows'] == int(len(new_orders) * refresh.HOLDOUT)
+    assert report['rows'] + report['holdout_rows'] == len(new_orders)
+    if report['rounds_added']:
+        assert report['holdout_mse_after'] < report['holdout_mse_before']
+
+    continue_boosting = refresh.continue_boosting
+
+    def overfit(booster, X_train, y_train, X_val, y_val, rounds, workers):
+        return continue_boosting(booster, X_train, y_train * 10, X_val[:0], y_val[:0], rounds, workers)
+    monkeypatch.setattr(refresh, 'continue_boosting', overfit)
+    booster, report = refresh.refresh_recommender(model, le_product, new_orders, database, refresh.REFRESH_ROUNDS,
+                                                  refresh.HOLDOUT, workers=1)
+    assert report['holdout_mse_after'] >= report['holdout_mse_before']
+    assert report['rounds_added'] == 0
+    assert booster.num_boosted_rounds() == model.get_booster().num_boosted_rounds()
+
+
+def test_demand_checks_new_trees_on_the_newest_days(shop):
+    database, _, demand_model, _ = shop
+    days = pd.date_range('2024-03-01', '2024-03-05')
+    new_orders = make_orders(1500, days, seed=4)
+    add_orders(database, new_orders)
+    extended, report = refresh.refresh_demand(demand_model, new_orders, PRODUCTS, database, {}, 5, 100,
+                                              refresh.HOLDOUT, workers=1)
+    assert (report['days'], report['holdout_days']) == (4, 1)
+    held_out = new_orders[new_orders['OrderDate'] == days[-1].strftime('%d/%m/%Y')]
+    assert report['holdout_rows'] == held_out['ProductName'].nunique()
+    assert 'holdout_mse_before' in report and 'holdout_mse_after' in report
+    if report['holdout_mse_after'] >= report['holdout_mse_before']:
+        assert extended is demand_model and report['trees_added'] == 0
+    else:
+        assert report['trees_added'] == 5 and len(extended.roots) == len(demand_model.roots) + 5
+
+
+class Recorder(RandomForestRegressor):
+    fitted = []
+
+    def fit(self, X, y):
+        self.fitted.append(X)
+        return super().fit(X, y)
+
+
+def test_demand_refresh_reads_only_the_new_days_and_reuses_the_training_encoding(shop, monkeypatch):
+    database, _, demand_model, _ = shop
+    history = read_orders(0, None, database)
+    _, demand_model.encoding = encode_demand_features(demand_frame(history, PRODUCTS))
+    new_orders = make_orders(300, pd.date_range('2024-03-01', '2024-03-01'), seed=5)
+    add_orders(database, new_orders)
+
+    def full_read(*args):
+        raise AssertionError("the whole Orders table was read")
+    monkeypatch.setattr(refresh, 'read_orders', full_read)
+    monkeypatch.setattr(refresh, 'RandomForestRegressor', Recorder)
+    monkeypatch.setattr(refresh, 'MIN_DEMAND_ROWS', 10)
+    Recorder.fitted = []
+    extended, report = refresh.refresh_demand(demand_model, new_orders, PRODUCTS, database, {}, 5, 100,
+                                              refresh.HOLDOUT, workers=1)
+    assert report['window_days'] == 1 + refresh.LAG_DAYS and 'encoding' not in report
+    assert report['trees_added'] == 5 and extended.encoding is demand_model.encoding
+
+    # The same features forecast_demand builds from the whole history, lags aside.
+    served = demand_frame(pd.concat([history, new_orders]), PRODUCTS)
+    X_served, _ = encode_demand_features(served, demand_model.encoding)
+    X_served = X_served[(served['OrderDate'] == pd.Timestamp('2024-03-01')).to_numpy()]
+    columns = [DEMAND_FEATURES.index(name) for name in DEMAND_FEATURES if not name.startswith(('Lag_', 'Rolling_'))]
+    assert np.allclose(Recorder.fitted[0][:, columns], X_served[:, columns])
+
+
+def test_demand_refresh_fits_an_encoding_once_for_versions_without_one(shop, monkeypatch):
+    database, _, demand_model, _ = shop
+    new_orders = make_orders(300, pd.date_range('2024-03-01', '2024-03-01'), seed=5)
+    add_orders(database, new_orders)
+    monkeypatch.setattr(refresh, 'RandomForestRegressor', Recorder)
+    monkeypatch.setattr(refresh, 'MIN_DEMAND_ROWS', 10)
+    Recorder.fitted = []
+    extended, report = refresh.refresh_demand(demand_model, new_orders, PRODUCTS, database, {}, 5, 100,
+                                              refresh.HOLDOUT, workers=1)
+    assert 'encoding' in report and extended.encoding is not None
+    assert report['holdout_days'] == 0 and 'holdout_mse_before' not in report
+    # Scaled over one day alone, OrderMonth would be a constant 0; over the history, March is above the mean.
+    assert np.all(Recorder.fitted[0][:, DEMAND_FEATURES.index('OrderMonth')] > 0)
+
+
+def test_forecast_uses_the_training_encoding_and_keeps_new_product_names(shop):
+    database, _, demand_model, _ = shop
+    history = read_orders(0, None, database)
+    _, demand_model.encoding = encode_demand_features(demand_frame(history, PRODUCTS))
+    new_product = pd.DataFrame({'ProductName': ['Product new'], 'Brand': ['Brand new'], 'Price': [5.0],
+                                'DiscountPrice': [4.0], 'Category': ['Category 0'], 'SubCategory': ['Sub 0']})
+    orders = pd.concat([history, make_orders(50, pd.date_range('2024-03-01', '2024-03-02'), seed=6).assign(ProductName='Product new')])
+    merged_df = forecast_demand(orders, pd.concat([PRODUCTS, new_product]), demand_model)
+    assert set(merged_df['ProductName']) == set(PRODUCTS['ProductName']) | {'Product new'}
+    assert merged_df['Predict Demand Score'].notna().all()
@@ -0,0 +1,123 @@
+import gc
+import threading
+import time
+
+import pandas as pd
+import pytest
+from streamlit.runtime.state.safe_session_state import SafeSessionState
+from streamlit.runtime.state.session_state import SessionState
+
+from session_memory import SessionRegistry, SharedTables
+
+EVICT_AFTER = 300
+SESSION_TTL = 3600
+
+
+def make_session(username):
+    state = SessionState()
+    state['username'] = username
+    state['cart'] = ['Onion']
+    state['filtered_products_df'] = pd.DataFrame({'ProductName': ['Onion'] * 1000})
+    return state
+
+
+def rerun(registry, session_id, state):
+    # Like a script run: Streamlit wraps the session's state in a new SafeSessionState each time.
+    wrapper = SafeSessionState(state, lambda: None)
+    with registry.active(session_id, wrapper):
+        pass
+
+
+@pytest.fixture
+def registry():
+    return SessionRegistry(session_ttl=SESSION_TTL, evict_after=EVICT_AFTER, sweep_interval=10**6)
+
+
+def test_sessions_stay_tracked_after_their_rerun_ends(registry):
+    states = {'s1': make_session('alice'), 's2': make_session('bob')}
+    for session_id, state in states.items():
+        rerun(registry, session_id, state)
+    gc.collect()
+    rows = registry.usage()
+    assert sorted(row['user'] for row in rows) == ['alice', 'bob']
+    assert all(row['largest_key'] == 'filtered_products_df' for row in rows)
+
+
+def test_idle_sessions_lose_recomputable_keys_then_everything(registry):
+    state = make_session('alice')
+    rerun(registry, 's1', state)
+    now = time.monotonic()
+
+    registry.sweep(now + EVICT_AFTER / 2)
+    assert 'filtered_products_df' in state
+
+    registry.sweep(now + EVICT_AFTER + 1)
+    assert 'filtered_products_df' not in state and state['cart'] == ['Onion']
+    assert registry.evicted == 1
+
+    registry.sweep(now + SESSION_TTL + 1)
+    registry.sweep(now + SESSION_TTL + 2)
+    assert state.filtered_state == {}
+    assert registry.expired == 1
+
+
+def test_sweep_leaves_a_rerunning_session_alone(registry):
+    state = make_session('alice')
+    rerun(registry, 's1', state)
+    started, finish = threading.Event(), threading.Event()
+
+    def long_rerun():
+        with registry.active('s1', SafeSessionState(state, lambda: None)):
+            started.set()
+            finish.wait(5)
+    thread = threading.Thread(target=long_rerun)
+    thread.start()
+    started.wait(5)
+    registry.sweep(time.monotonic() + SESSION_TTL + 1)
+    assert state['username'] == 'alice' and 'filtered_products_df' in state
+    assert registry.expired == registry.evicted == 0
+    finish.set()
+    thread.join()
+
+
+def test_a_session_returning_after_the_ttl_is_logged_out_by_its_own_rerun():
+    registry = SessionRegistry(session_ttl=0.05, evict_after=0.01, sweep_interval=10**6)
+    state = make_session('alice')
+    rerun(registry, 's1', state)
+    time.sleep(0.1)
+    with registry.active('s1', SafeSessionState(state, lambda: None)):
+        assert state.filtered_state == {}
+    assert registry.expired == 1
+
+
+def test_closed_sessions_are_dropped():
+    active = {'s1', 's2'}
+    registry = SessionRegistry(sweep_interval=10**6, is_active=lambda session_id: session_id in active)
+    rerun(registry, 's1', make_session('alice'))
+    rerun(registry, 's2', make_session('bob'))
+    active.discard('s1')
+    assert [row['user'] for row in registry.usage()] == ['bob']
+    registry.sweep()
+    assert [session_id for session_id, _ in registry._entries()] == ['s2']
+
+
+def test_a_state_that_does_not_unwrap_to_a_session_state_is_refused(registry):
+    with pytest.raises(TypeError, match='SessionState'):
+        with registry.active('s1', SafeSessionState({'username': 'alice'}, lambda: None)):
+            pass
+    assert registry._entries() == []
+
+
+def test_shared_tables_reload_only_when_the_version_changes():
+    loads = []
+    version = [1]
+
+    def load(name):
+        loads.append(name)
+        return pd.DataFrame({'v': [version[0]]})
+    tables = SharedTables(load, {'products': lambda: version[0]})
+    first = tables.get('products')
+    assert tables.get('products') is first
+    version[0] = 2
+    assert tables.get('products')['v'].tolist() == [2]
+    assert loads == ['products', 'products']
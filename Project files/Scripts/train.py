@@ -0,0 +1,188 @@
+import argparse
+import json
+import os
+import platform
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import mean_squared_error, r2_score
+from sklearn.model_selection import ParameterGrid, TimeSeriesSplit
+from sklearn.preprocessing import LabelEncoder
+from xgboost import XGBRegressor
+
+import model_registry
+from db import DATABASE, orders_watermark, read_orders, read_table
+from features import DEMAND_FEATURES, customer_features, demand_frame, encode_demand_features, parse_order_dates, recommender_frame
+from recommender import FEATURES
+
+SEED = 42
+XGB_GRID = {'max_depth': [3, 5, 7], 'learning_rate': [0.01, 0.1, 0.3]}
+XGB_MAX_ROUNDS = 1000
+EARLY_STOPPING_ROUNDS = 20
+EARLY_STOPPING_FRACTION = 0.2
+RF_GRID = {'n_estimators': [50, 100], 'max_depth': [10, None], 'min_samples_split': [2, 5], 'min_samples_leaf': [1, 2]}
+
+
+def time_split(order_dates, test_fraction):
+    # Everything on or after the cutoff day is held out, so no day is split between train and test.
+    cutoff = order_dates.sort_values().iloc[int(len(order_dates) * (1 - test_fraction))]
+    return (order_dates < cutoff).to_numpy(), (order_dates >= cutoff).to_numpy()
+
+
+def fit_xgb_fold(params, X, y, train_idx, val_idx):
+    # The newest slice of the training fold decides when to stop boosting, so the validation
+    # fold is only used for the score and the cv_mse stays an out-of-sample estimate.
+    n_stop = max(int(len(train_idx) * EARLY_STOPPING_FRACTION), 1)
+    fit_idx, stop_idx = train_idx[:-n_stop], train_idx[-n_stop:]
+    model = XGBRegressor(objective='reg:squarederror', n_estimators=XGB_MAX_ROUNDS, early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+                         random_state=SEED, n_jobs=1, **params)
+    model.fit(X[fit_idx], y[fit_idx], eval_set=[(X[stop_idx], y[stop_idx])], verbose=False)
+    mse = mean_squared_error(y[val_idx], model.predict(X[val_idx]))
+    return {'mse': mse, 'rounds': model.best_iteration + 1}
+
+
+def fit_rf_fold(params, X, y, train_idx, val_idx):
+    model = RandomForestRegressor(random_state=SEED, n_jobs=1, **params)
+    model.fit(X[train_idx], y[train_idx])
+    return {'mse': mean_squared_error(y[val_idx], model.predict(X[val_idx]))}
+
+
+def search(fit_fold, grid, X, y, n_splits, workers):
+    # X and y must be in time order; every (candidate, fold) pair is an independent task.
+    candidates = list(ParameterGrid(grid))
+    folds = list(TimeSeriesSplit(n_splits=n_splits).split(X))
+    start = time.perf_counter()
+    scores = Parallel(n_jobs=workers)(
+        delayed(fit_fold)(params, X, y, train_idx, val_idx) for params in candidates for train_idx, val_idx in folds
+    )
+    elapsed = time.perf_counter() - start
+    results = []
+    for i, params in enumerate(candidates):
+        fold_scores = scores[i * len(folds):(i + 1) * len(folds)]
+        result = {'params': params, 'cv_mse': float(np.mean([s['mse'] for s in fold_scores]))}
+        if 'rounds' in fold_scores[0]:
+            result['rounds'] = int(np.mean([s['rounds'] for s in fold_scores]))
+        results.append(result)
+    results.sort(key=lambda r: r['cv_mse'])
+    return results, elapsed
+
+
+def recommender_data(orders_df, products_df, test_fraction):
+    le_product = LabelEncoder().fit(pd.concat([orders_df['ProductName'], products_df['ProductName']]).unique())
+    product_ids = le_product.transform(orders_df['ProductName'])
+    train_mask, test_mask = time_split(parse_order_dates(orders_df['OrderDate']), test_fraction)
+    # Customer aggregates come from the training window only, so the held-out weeks stay unseen.
+    train_customers = customer_features(orders_df[train_mask], product_ids[train_mask])
+    frame = recommender_frame(orders_df, product_ids, train_customers)
+    order = np.argsort(frame['OrderDate'].to_numpy()[train_mask], kind='stable')
+    train, test = frame[train_mask].iloc[order], frame[test_mask]
+    return le_product, train, test
+
+
+def demand_data(orders_df, products_df, test_fraction):
+    merged_df = demand_frame(orders_df, products_df)
+    X_scaled, encoding = encode_demand_features(merged_df)
+    order = np.argsort(merged_df['OrderDate'].to_numpy(), kind='stable')
+    X, y, order_dates = X_scaled[order], merged_df['Quantity'].to_numpy()[order], merged_df['OrderDate'].iloc[order]
+    train_mask, test_mask = time_split(order_dates, test_fraction)
+    return X[train_mask], y[train_mask], X[test_mask], y[test_mask], encoding
+
+
+def regression_metrics(y_true, y_pred):
+    mse = mean_squared_error(y_true, y_pred)
+    return {'mse': float(mse), 'rmse': float(np.sqrt(mse)), 'r2': float(r2_score(y_true, y_pred))}
+
+
+def train(database, workers, n_splits, test_fraction, scaling=None):
+    report = {'database': os.path.abspath(database), 'workers': workers, 'cv_splits': n_splits,
+              'test_fraction': test_fraction, 'seed': SEED, 'timings': {}}
+    timings = report['timings']
+
+    start = time.perf_counter()
+    # Orders placed while training are left for the next incremental refresh.
+    report['watermark'] = orders_watermark(database)
+    orders_df = read_orders(0, report['watermark']['rowid'] if report['watermark'] else 0, database)
+    products_df = read_table("ProductsOnWebsite", database)
+    le_product, rec_train, rec_test = recommender_data(orders_df, products_df, test_fraction)
+    X_demand, y_demand, X_demand_test, y_demand_test, demand_encoding = demand_data(orders_df, products_df, test_fraction)
+    timings['features'] = time.perf_counter() - start
+    report['rows'] = {'orders': len(orders_df), 'recommender_train': len(rec_train), 'recommender_test': len(rec_test),
+                      'demand_train': len(X_demand), 'demand_test': len(X_demand_test)}
+
+    X_rec = rec_train[FEATURES].to_numpy(dtype=np.float32)
+    y_rec = rec_train['Quantity'].to_numpy(dtype=np.float32)
+    if scaling:
+        report['scaling'] = []
+        for n_workers in scaling:
+            _, xgb_seconds = search(fit_xgb_fold, XGB_GRID, X_rec, y_rec, n_splits, n_workers)
+            _, rf_seconds = search(fit_rf_fold, RF_GRID, X_demand, y_demand, n_splits, n_workers)
+            report['scaling'].append({'workers': n_workers, 'recommender_search': xgb_seconds, 'demand_search': rf_seconds})
+
+    xgb_results, timings['recommender_search'] = search(fit_xgb_fold, XGB_GRID, X_rec, y_rec, n_splits, workers)
+    best = xgb_results[0]
+    start = time.perf_counter()
+    model = XGBRegressor(objective='reg:squarederror', n_estimators=best['rounds'], random_state=SEED, n_jobs=workers, **best['params'])
+    model.fit(rec_train[FEATURES], rec_train['Quantity'])
+    timings['recommender_fit'] = time.perf_counter() - start
+    report['recommender'] = {'best': best, 'search': xgb_results,
+                             'test': regression_metrics(rec_test['Quantity'], model.predict(rec_test[FEATURES]))}
+
+    rf_results, timings['demand_search'] = search(fit_rf_fold, RF_GRID, X_demand, y_demand, n_splits, workers)
+    start = time.perf_counter()
+    demand_model = RandomForestRegressor(random_state=SEED, n_jobs=workers, **rf_results[0]['params'])
+    demand_model.fit(X_demand, y_demand)
+    # Published with the model, so serving and refreshes encode orders the way training did.
+    demand_model.encoding = demand_encoding
+    timings['demand_fit'] = time.perf_counter() - start
+    report['demand'] = {'best': rf_results[0], 'search': rf_results, 'features': DEMAND_FEATURES,
+                        'test': regression_metrics(y_demand_test, demand_model.predict(X_demand_test))}
+    return model, demand_model, le_product, report
+
+
+def print_report(report):
+    print(f"Orders: {report['rows']['orders']}")
+    for name in ('recommender', 'demand'):
+        section = report[name]
+        print(f"{name:<12} best {section['best']['params']}  cv_mse={section['best']['cv_mse']:.4f}  "
+              f"test_mse={section['test']['mse']:.4f}  test_r2={section['test']['r2']:.4f}")
+    print("Timings: " + ", ".join(f"{stage}={seconds:.1f}s" for stage, seconds in report['timings'].items()))
+    if report.get('scaling'):
+        base = report['scaling'][0]
+        print(f"{'workers':>8}{'recommender':>14}{'demand':>10}{'speedup':>10}")
+        for row in report['scaling']:
+            total = row['recommender_search'] + row['demand_search']
+            speedup = (base['recommender_search'] + base['demand_search']) / total
+            print(f"{row['workers']:>8}{row['recommender_search']:>13.1f}s{row['demand_search']:>9.1f}s{speedup:>9.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the recommender and demand models from BigBasket.db and publish them.")
+    parser.add_argument('--database', default=DATABASE)
+    parser.add_argument('--registry', default=model_registry.REGISTRY_DIR)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--cv-splits', type=int, default=3)
+    parser.add_argument('--test-fraction', type=float, default=0.2)
+    parser.add_argument('--scaling', type=int, nargs='+', help="Also time the searches with each of these worker counts")
+    parser.add_argument('--version', help="Registry version name (defaults to a timestamp)")
+    parser.add_argument('--no-activate', action='store_true', help="Publish without pointing the app at the new version")
+    parser.add_argument('--report', help="Also write the training report to this JSON file")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    model, demand_model, le_product, report = train(args.database, args.workers, args.cv_splits, args.test_fraction, args.scaling)
+    report['timings']['total'] = time.perf_counter() - start
+    report['environment'] = {'python': platform.python_version(), 'cpu_count': os.cpu_count()}
+    version = model_registry.publish(model, demand_model, le_product, args.registry, args.version, report,
+                                     activate=not args.no_activate)
+    print_report(report)
+    print(f"Published {version}{'' if args.no_activate else ' (active)'}")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+
+
+if __name__ == '__main__':
+    main()